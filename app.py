@@ -3,6 +3,9 @@ import pandas as pd
 import os
 from datetime import datetime
 
+# Copy-on-write: filtros e seleções do pandas não duplicam dados até haver escrita
+pd.set_option('mode.copy_on_write', True)
+
 # Configuração otimizada para reduzir uso de recursos
 st.set_page_config(
     page_title="Análise de Infrações IBAMA (versão beta)", 
@@ -604,6 +607,10 @@ def reset_cache_for_correction():
             # Limpa cache global
             st.cache_data.clear()
             st.cache_resource.clear()
+            
+            # A tabela pré-agregada também é refeita (recriada no DuckDB, atualizada no Supabase)
+            if 'db' in st.session_state:
+                st.session_state.db.refresh_aggregate_source()
         
         st.success("✅ **Cache limpo para correção!**")
         st.success("✅ Próximas consultas usarão algoritmo corrigido")
@@ -859,8 +866,12 @@ def main():
                 st.cache_data.clear()
                 st.cache_resource.clear()
                 
+                # A tabela pré-agregada também é refeita (recriada no DuckDB, atualizada no Supabase)
+                if 'db' in st.session_state:
+                    st.session_state.db.refresh_aggregate_source()
+                
                 # Remove dados da sessão
-                session_keys_to_remove = ['viz', 'chatbot']
+                session_keys_to_remove = ['viz', 'chatbot', 'data_quality_info']
                 for key in session_keys_to_remove:
                     if key in st.session_state:
                         del st.session_state[key]
@@ -871,15 +882,14 @@ def main():
             except Exception as e:
                 st.error(f"❌ Erro ao limpar cache: {str(e)}")
         
-        # Informações sobre qualidade dos dados
-        if st.button("📊 Qualidade dos Dados", help="Exibe informações detalhadas sobre os dados carregados"):
-            if hasattr(st.session_state, 'viz'):
-                try:
-                    st.session_state.viz.display_data_quality_info(selected_ufs, date_filters)
-                except Exception as e:
-                    st.error(f"❌ Erro ao obter informações de qualidade: {str(e)}")
-            else:
-                st.warning("⚠️ Componente de visualização não inicializado")
+        # Informações sobre qualidade dos dados (o cálculo só ocorre ao clicar dentro do expander)
+        if hasattr(st.session_state, 'viz'):
+            try:
+                st.session_state.viz.display_data_quality_info(selected_ufs, date_filters)
+            except Exception as e:
+                st.error(f"❌ Erro ao obter informações de qualidade: {str(e)}")
+        else:
+            st.warning("⚠️ Componente de visualização não inicializado")
 
         st.divider()
         
@@ -975,20 +985,7 @@ def main():
         
         try:
             # Passa os novos filtros para as visualizações
-            st.session_state.viz.create_overview_metrics_advanced(selected_ufs, date_filters)
-            st.divider()
-            st.session_state.viz.create_infraction_map_advanced(selected_ufs, date_filters)
-            st.divider()
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                st.session_state.viz.create_municipality_hotspots_chart_advanced(selected_ufs, date_filters)
-                st.session_state.viz.create_fine_value_by_type_chart_advanced(selected_ufs, date_filters)
-                st.session_state.viz.create_gravity_distribution_chart_advanced(selected_ufs, date_filters)
-            with col2:
-                st.session_state.viz.create_state_distribution_chart_advanced(selected_ufs, date_filters)
-                st.session_state.viz.create_infraction_status_chart_advanced(selected_ufs, date_filters)
-                st.session_state.viz.create_main_offenders_chart_advanced(selected_ufs, date_filters)
+            st.session_state.viz.render_dashboard(selected_ufs, date_filters)
         except Exception as e:
             st.error(f"Erro ao gerar visualizações: {e}")
             st.info("Tentando recarregar os componentes...")
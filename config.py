@@ -52,6 +52,8 @@ SERPER_API_KEY = get_secret('SERPER_API_KEY')
 
 # Database
 DB_PATH = get_secret('DB_PATH', default='data/ibama_infracao.db')
+# Cópia Parquet particionada por UF, lida pelo DuckDB com pushdown de filtros/colunas
+PARQUET_DIR = get_secret('PARQUET_DIR', default='data/ibama')
 
 # Supabase Credentials
 SUPABASE_URL = get_secret('SUPABASE_URL')
@@ -5,6 +5,18 @@ from typing import Dict, Any, Optional
 from fuzzywuzzy import process
 import re
 
+from src.utils.supabase_utils import SupabasePaginator, non_empty_mask, parse_decimal_values, PYARROW_AVAILABLE
+
+# Colunas usadas pelas análises do chatbot (projeção enviada ao servidor em vez de select *)
+CHATBOT_COLUMNS = [
+    'NUM_AUTO_INFRACAO', 'UF', 'MUNICIPIO', 'TIPO_INFRACAO', 'GRAVIDADE_INFRACAO',
+    'VAL_AUTO_INFRACAO', 'NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'
+]
+
+# Colunas de baixa cardinalidade mantidas como category no cache do chatbot
+CHATBOT_CATEGORICAL_COLUMNS = ['TIPO_INFRACAO', 'UF', 'MUNICIPIO']
+DOC_TYPE_CATEGORIES = ['CPF', 'CNPJ', 'Unknown']
+
 class ChatbotFixed:
     def __init__(self, llm_integration=None):
         self.llm_integration = llm_integration
@@ -36,18 +48,12 @@ class ChatbotFixed:
                     self.llm_integration.database.is_cloud and 
                     self.llm_integration.database.supabase):
                     
-                    try:
-                        from src.utils.supabase_utils import SupabasePaginator
-                        paginator = SupabasePaginator(self.llm_integration.database.supabase)
-                        self.cached_data = paginator.get_all_records()
-                        
-                        # CORREÇÃO: Processa os dados carregados
-                        self.cached_data = self._process_cached_data(self.cached_data)
-                        print(f"✅ Cache carregado e processado: {len(self.cached_data)} registros")
-                    except ImportError:
-                        result = self.llm_integration.database.supabase.table('ibama_infracao').select('*').limit(50000).execute()
-                        self.cached_data = pd.DataFrame(result.data)
-                        self.cached_data = self._process_cached_data(self.cached_data)
+                    paginator = SupabasePaginator(self.llm_integration.database.supabase)
+                    self.cached_data = paginator.get_all_records(columns=CHATBOT_COLUMNS)
+                    
+                    # CORREÇÃO: Processa os dados carregados
+                    self.cached_data = self._process_cached_data(self.cached_data)
+                    print(f"✅ Cache carregado e processado: {len(self.cached_data)} registros")
                 else:
                     self.cached_data = pd.DataFrame()
                     
@@ -66,22 +72,38 @@ class ChatbotFixed:
         if 'NUM_AUTO_INFRACAO' in df.columns:
             df = df.drop_duplicates(subset=['NUM_AUTO_INFRACAO'], keep='first')
         
-        # Converte valores monetários para float
-        if 'VAL_AUTO_INFRACAO' in df.columns:
-            df['VAL_AUTO_INFRACAO_NUMERIC'] = pd.to_numeric(
-                df['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.'), 
-                errors='coerce'
-            )
+        # Converte valores monetários para float (o paginador já entrega a coluna convertida na carga)
+        if 'VAL_AUTO_INFRACAO' in df.columns and 'VAL_AUTO_INFRACAO_NUMERIC' not in df.columns:
+            df['VAL_AUTO_INFRACAO_NUMERIC'] = parse_decimal_values(df['VAL_AUTO_INFRACAO'])
         
         # Classifica CPF/CNPJ corretamente
         if 'CPF_CNPJ_INFRATOR' in df.columns:
-            df['DOC_TYPE'] = df['CPF_CNPJ_INFRATOR'].apply(self._classify_cpf_cnpj)
+            # Só três valores possíveis: category com dicionário fixo em vez de strings por linha
+            df['DOC_TYPE'] = pd.Categorical(
+                df['CPF_CNPJ_INFRATOR'].apply(self._classify_cpf_cnpj), categories=DOC_TYPE_CATEGORIES
+            )
         
         # Limpa campos de texto
-        text_columns = ['NOME_INFRATOR', 'TIPO_INFRACAO', 'UF', 'MUNICIPIO']
-        for col in text_columns:
+        # (string do pandas, de preferência Arrow: strip no kernel nativo e nulos continuam nulos, não 'nan')
+        if 'NOME_INFRATOR' in df.columns:
+            names = df['NOME_INFRATOR']
+            if not isinstance(names.dtype, pd.StringDtype):
+                names = names.astype('string[pyarrow]' if PYARROW_AVAILABLE else 'string')
+            df['NOME_INFRATOR'] = names.str.strip()
+        
+        # Colunas repetitivas ficam como category (contagens e groupby sobre códigos inteiros);
+        # o strip é aplicado só ao dicionário de categorias, não a cada linha
+        for col in CHATBOT_CATEGORICAL_COLUMNS:
             if col in df.columns:
-                df[col] = df[col].astype(str).str.strip()
+                values = df[col]
+                if not isinstance(values.dtype, pd.CategoricalDtype):
+                    values = values.astype('category')
+                categories = values.cat.categories
+                stripped = categories.astype(str).str.strip()
+                if stripped.is_unique:
+                    df[col] = values.cat.rename_categories(stripped)
+                else:
+                    df[col] = values.map(dict(zip(categories, stripped))).astype('category')
         
         return df
     
@@ -193,24 +215,24 @@ class ChatbotFixed:
                 return {"answer": "❌ Colunas necessárias não encontradas.", "source": "error"}
             
             # Remove valores inválidos
+            # (category: a comparação com '' roda sobre as categorias, não sobre cada linha)
             df_clean = df[
-                df['TIPO_INFRACAO'].notna() & 
-                df['VAL_AUTO_INFRACAO_NUMERIC'].notna() &
-                (df['TIPO_INFRACAO'] != '') &
-                (df['VAL_AUTO_INFRACAO_NUMERIC'] > 0)
+                non_empty_mask(df['TIPO_INFRACAO']) &
+                (df['VAL_AUTO_INFRACAO_NUMERIC'] > 0).to_numpy()
             ]
             
             if df_clean.empty:
                 return {"answer": "❌ Nenhum dado válido encontrado.", "source": "error"}
             
             # CORREÇÃO: Soma valores por tipo (não conta registros)
-            values_by_type = df_clean.groupby('TIPO_INFRACAO')['VAL_AUTO_INFRACAO_NUMERIC'].sum().sort_values(ascending=False)
+            values_by_type = df_clean.groupby('TIPO_INFRACAO', observed=True)['VAL_AUTO_INFRACAO_NUMERIC'].sum()
             
             total_value = values_by_type.sum()
             
             answer = "**💰 Valor Total de Multas por Tipo de Infração:**\n\n"
             
-            for i, (tipo, valor) in enumerate(values_by_type.head(10).items(), 1):
+            # nlargest faz seleção parcial; só os 10 exibidos são ordenados
+            for i, (tipo, valor) in enumerate(values_by_type.nlargest(10).items(), 1):
                 percentage = (valor / total_value) * 100
                 answer += f"{i}. **{tipo.title()}**: {self._format_currency_brazilian(valor)} ({percentage:.1f}%)\n"
             
@@ -228,13 +250,14 @@ class ChatbotFixed:
             if 'GRAVIDADE_INFRACAO' not in df.columns:
                 return {"answer": "❌ Coluna de gravidade não encontrada.", "source": "error"}
             
-            # Substitui valores nulos/vazios por "Sem avaliação"
-            df_processed = df.copy()
-            df_processed['GRAVIDADE_INFRACAO'] = df_processed['GRAVIDADE_INFRACAO'].fillna('Sem avaliação')
-            df_processed['GRAVIDADE_INFRACAO'] = df_processed['GRAVIDADE_INFRACAO'].replace('', 'Sem avaliação')
+            # Conta sobre os códigos da coluna (category vinda do paginador), sem copiar o DataFrame
+            raw_counts = df['GRAVIDADE_INFRACAO'].value_counts(dropna=False)
+            raw_counts = raw_counts[raw_counts > 0]
             
-            # Conta infrações por gravidade
-            gravity_counts = df_processed['GRAVIDADE_INFRACAO'].value_counts()
+            # Nulos/vazios viram "Sem avaliação" apenas nos rótulos já agregados
+            labels = pd.Series(raw_counts.index.astype(object), index=raw_counts.index)
+            labels = labels.fillna('Sem avaliação').replace('', 'Sem avaliação')
+            gravity_counts = raw_counts.groupby(labels, sort=False).sum().sort_values(ascending=False, kind='stable')
             total_infractions = gravity_counts.sum()
             
             answer = "**⚖️ Distribuição de Infrações por Gravidade:**\n\n"
@@ -279,19 +302,16 @@ class ChatbotFixed:
             
             # Remove valores inválidos
             df_clean = df[
-                df['NOME_INFRATOR'].notna() & 
-                df['CPF_CNPJ_INFRATOR'].notna() &
-                df['VAL_AUTO_INFRACAO_NUMERIC'].notna() &
-                (df['NOME_INFRATOR'] != '') & 
-                (df['CPF_CNPJ_INFRATOR'] != '') &
-                (df['VAL_AUTO_INFRACAO_NUMERIC'] > 0)
+                non_empty_mask(df['NOME_INFRATOR']) &
+                non_empty_mask(df['CPF_CNPJ_INFRATOR']) &
+                (df['VAL_AUTO_INFRACAO_NUMERIC'] > 0).to_numpy()
             ]
             
             if df_clean.empty:
                 return {"answer": "❌ Dados válidos não disponíveis.", "source": "error"}
             
             # CORREÇÃO: Agrupa por infrator e SOMA valores (não conta registros)
-            top_offenders = df_clean.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().sort_values(ascending=False).head(10)
+            top_offenders = df_clean.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().nlargest(10)
             
             answer = "**💰 Top 10 Infratores por Valor Total de Multas:**\n\n"
             
@@ -403,6 +423,7 @@ class ChatbotFixed:
                 return {"answer": "❌ Coluna de tipos de infração não encontrada.", "source": "error"}
             
             infraction_types = df_filtered['TIPO_INFRACAO'].value_counts()
+            infraction_types = infraction_types[infraction_types > 0]  # category lista também os tipos sem ocorrência
             
             answer = f"**🏢 Infrações encontradas para '{search_name}':**\n\n"
             
@@ -450,11 +471,12 @@ class ChatbotFixed:
             elif "pessoas" in question_lower or "cpf" in question_lower:
                 filters['DOC_TYPE'] = 'CPF'
             
-            # Aplica filtros
-            df_filtered = df.copy()
+            # Aplica filtros: uma máscara combinada e uma única seleção, sem copiar o DataFrame antes
+            mask = pd.Series(True, index=df.index)
             for column, value in filters.items():
-                if column in df_filtered.columns:
-                    df_filtered = df_filtered[df_filtered[column] == value]
+                if column in df.columns:
+                    mask &= df[column] == value
+            df_filtered = df[mask]
             
             if df_filtered.empty:
                 filter_description = ', '.join([f"{k}={v}" for k, v in filters.items()])
@@ -466,7 +488,7 @@ class ChatbotFixed:
                     return {"answer": "❌ Dados de valores não disponíveis.", "source": "error"}
                 
                 # Agrupa por infrator e soma valores
-                top_by_value = df_filtered.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().sort_values(ascending=False).head(10)
+                top_by_value = df_filtered.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().nlargest(10)
                 
                 filter_description = ', '.join([f"{k}: {v}" for k, v in filters.items()])
                 answer = f"**💰 Top 10 por Valor Total - {filter_description}:**\n\n"
@@ -482,7 +504,7 @@ class ChatbotFixed:
                 
             else:
                 # Análise por quantidade de infrações
-                top_by_count = df_filtered.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR']).size().sort_values(ascending=False).head(10)
+                top_by_count = df_filtered.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR']).size().nlargest(10)
                 
                 filter_description = ', '.join([f"{k}: {v}" for k, v in filters.items()])
                 answer = f"**📊 Top 10 por Quantidade - {filter_description}:**\n\n"
@@ -505,11 +527,14 @@ class ChatbotFixed:
             if 'UF' not in df.columns:
                 return {"answer": "❌ Coluna UF não encontrada.", "source": "error"}
             
-            state_counts = df['UF'].value_counts().head(10)
+            # Contagem sem ordenar todas as UFs; só as 10 maiores são selecionadas
+            state_counts = df['UF'].value_counts(sort=False)
+            state_counts = state_counts[state_counts > 0].nlargest(10)
+            top_total = state_counts.sum()
             
             answer = "**🏆 Top Estados com Mais Infrações:**\n\n"
             for i, (uf, count) in enumerate(state_counts.items(), 1):
-                percentage = (count / state_counts.sum()) * 100
+                percentage = (count / top_total) * 100
                 answer += f"{i}. **{uf}**: {count:,} infrações ({percentage:.1f}%)\n"
             
             return {"answer": answer, "source": "data_analysis"}
@@ -524,7 +549,7 @@ class ChatbotFixed:
                 return {"answer": "❌ Colunas necessárias não encontradas.", "source": "error"}
             
             df_clean = df[df['MUNICIPIO'].notna() & df['UF'].notna()]
-            muni_counts = df_clean.groupby(['MUNICIPIO', 'UF']).size().sort_values(ascending=False).head(10)
+            muni_counts = df_clean.groupby(['MUNICIPIO', 'UF'], observed=True).size().nlargest(10)
             
             answer = "**🏙️ Top Municípios com Mais Infrações:**\n\n"
             for i, ((municipio, uf), count) in enumerate(muni_counts.items(), 1):
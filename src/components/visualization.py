@@ -1,39 +1,612 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
+import pydeck as pdk
+import streamlit.components.v1 as components
+import functools
+import hashlib
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-# Importa as funções de formatação
-from src.utils.formatters import format_currency_brazilian, format_number_brazilian
+# numba é opcional: acelera contagens em bases grandes, com fallback para pandas
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
-# Importa o paginador CORRIGIDO
+# polars é opcional: groupby multi-thread nas agregações com chaves de texto
 try:
-    from src.utils.supabase_utils import SupabasePaginator
+    import polars as pl
+    POLARS_AVAILABLE = True
 except ImportError:
-    # Fallback se o arquivo não existir
-    class SupabasePaginator:
-        def __init__(self, supabase_client):
-            self.supabase = supabase_client
-        
-        def get_filtered_data(self, selected_ufs=None, year_range=None):
-            # Método simples sem paginação como fallback
-            result = self.supabase.table('ibama_infracao').select('*').limit(50000).execute()
-            df = pd.DataFrame(result.data)
-            
-            if selected_ufs and not df.empty:
-                df = df[df['UF'].isin(selected_ufs)]
-            
-            if year_range and 'DAT_HORA_AUTO_INFRACAO' in df.columns:
-                try:
-                    df['DAT_HORA_AUTO_INFRACAO'] = pd.to_datetime(df['DAT_HORA_AUTO_INFRACAO'], errors='coerce')
-                    df = df[
-                        (df['DAT_HORA_AUTO_INFRACAO'].dt.year >= year_range[0]) &
-                        (df['DAT_HORA_AUTO_INFRACAO'].dt.year <= year_range[1])
-                    ]
-                except:
-                    pass
-            
-            return df
+    POLARS_AVAILABLE = False
+
+# Importa as funções de formatação
+from src.utils.formatters import format_currency_brazilian, format_number_brazilian
+
+# Valor numérico da multa e ordem da deduplicação em SQL, os mesmos da tabela pré-agregada
+from src.utils.database import FINE_VALUE_SQL, DEDUP_ORDER_SQL, is_sql_error
+
+# Importa o paginador CORRIGIDO e os utilitários de carga
+from src.utils.supabase_utils import SupabasePaginator, optimize_dtypes, arrow_to_pandas, records_to_dataframe, filter_date_ranges, non_empty_mask, first_infraction_mask, PYARROW_AVAILABLE
+
+# Colunas de cada gráfico (projeção enviada ao servidor); as colunas-base entram sempre
+BASE_COLUMNS = ['NUM_AUTO_INFRACAO', 'UF', 'DAT_HORA_AUTO_INFRACAO']
+CHART_COLUMNS = {
+    'overview': ['MUNICIPIO', 'COD_MUNICIPIO', 'VAL_AUTO_INFRACAO'],
+    'map': ['NUM_LATITUDE_AUTO', 'NUM_LONGITUDE_AUTO'],
+    'municipality': ['MUNICIPIO', 'COD_MUNICIPIO'],
+    'fine_by_type': ['TIPO_INFRACAO', 'VAL_AUTO_INFRACAO'],
+    'gravity': ['GRAVIDADE_INFRACAO'],
+    'state': [],
+    'status': ['DES_STATUS_FORMULARIO'],
+    'offenders': ['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR', 'VAL_AUTO_INFRACAO'],
+}
+DASHBOARD_COLUMNS = sorted(set(BASE_COLUMNS).union(*CHART_COLUMNS.values()))
+
+# Colunas que o gráfico descarta quando nulas/vazias: filtradas já na busca (fora do painel completo)
+CHART_REQUIRED = {
+    'map': ['NUM_LATITUDE_AUTO', 'NUM_LONGITUDE_AUTO'],
+    'status': ['DES_STATUS_FORMULARIO'],
+}
+
+@functools.lru_cache(maxsize=None)
+def _px():
+    """plotly.express (import pesado) carregado só quando o primeiro gráfico de barras/pizza é montado."""
+    import plotly.express as px
+    return px
+
+# Validade dos caches de dados, agregações e figuras: a base é recarregada uma vez por dia,
+# e o botão "Limpar Cache" força a releitura antes disso
+DATA_CACHE_TTL = 3600
+
+# Configuração comum dos gráficos Plotly: menos trabalho no cliente a cada rerun
+PLOTLY_CONFIG = {'displaylogo': False, 'responsive': True, 'scrollZoom': False}
+
+# Resolução da grade do mapa de calor, em casas decimais de grau (2 -> ~1 km)
+MAP_GRID_DECIMALS = 2
+
+# Máximo de células do mapa; acima disso a grade perde uma casa decimal (~10x mais grossa)
+MAP_MAX_CELLS = 5000
+
+# Casas decimais das coordenadas enviadas ao navegador (4 -> ~11 m, bem abaixo da célula)
+MAP_COORD_DECIMALS = 4
+
+# A partir deste tamanho as contagens por categoria usam o kernel numba
+NUMBA_MIN_ROWS = 100_000
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _count_codes(codes, n_categories):
+        """Conta ocorrências de cada código de categoria (-1 = nulo é ignorado)."""
+        counts = np.zeros(n_categories, dtype=np.int64)
+        for i in range(codes.shape[0]):
+            code = codes[i]
+            if code >= 0:
+                counts[code] += 1
+        return counts
+
+    @njit(cache=True)
+    def _distinct_ints(values):
+        """Conta inteiros distintos numa tabela hash de endereçamento aberto (uma passada linear)."""
+        capacity = 16
+        while capacity < 2 * values.shape[0]:
+            capacity *= 2
+        mask = capacity - 1
+        table = np.empty(capacity, dtype=np.int64)
+        used = np.zeros(capacity, dtype=np.bool_)
+        distinct = 0
+        for i in range(values.shape[0]):
+            value = values[i]
+            slot = (value * 2654435761) & mask
+            while used[slot] and table[slot] != value:
+                slot = (slot + 1) & mask
+            if not used[slot]:
+                used[slot] = True
+                table[slot] = value
+                distinct += 1
+        return distinct
+
+    @njit(cache=True)
+    def _compact_coords(lat, lon):
+        """Numa única passada descarta pares com NaN e já promove os válidos a float64."""
+        n = lat.shape[0]
+        out_lat = np.empty(n, dtype=np.float64)
+        out_lon = np.empty(n, dtype=np.float64)
+        k = 0
+        for i in range(n):
+            a = lat[i]
+            b = lon[i]
+            if a == a and b == b:  # NaN é o único valor diferente de si mesmo
+                out_lat[k] = a
+                out_lon[k] = b
+                k += 1
+        return out_lat[:k], out_lon[:k]
+
+def _count_distinct(values: pd.Series) -> int:
+    """Equivalente a nunique(), com kernel numba para category e inteiros em bases grandes."""
+    if NUMBA_AVAILABLE and len(values) > NUMBA_MIN_ROWS:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            counts = _count_codes(values.cat.codes.to_numpy(), len(values.cat.categories))
+            return int((counts > 0).sum())
+        if pd.api.types.is_integer_dtype(values):
+            return int(_distinct_ints(values.dropna().to_numpy(dtype=np.int64)))
+    return int(values.nunique())
+
+def _bin_coordinates(lat: np.ndarray, lon: np.ndarray, decimals: int = MAP_GRID_DECIMALS) -> pd.DataFrame:
+    """Agrega coordenadas numa grade regular, preservando a densidade real dos focos."""
+    scale = 10 ** decimals
+    lat_i = np.round(lat * scale).astype(np.int64)
+    lon_i = np.round(lon * scale).astype(np.int64)
+    
+    # Chave inteira única por célula (longitude deslocada para ficar não negativa)
+    width = 360 * scale + 1
+    keys = lat_i * width + (lon_i + 180 * scale)
+    cells, inv = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inv)
+    
+    # Centróide dos pontos de cada célula (não o canto da grade): focos ficam onde estão
+    return pd.DataFrame({
+        'lat': np.bincount(inv, weights=lat) / counts,
+        'lon': np.bincount(inv, weights=lon) / counts,
+        'count': counts
+    })
+
+# Abaixo deste tamanho a conversão para Polars custa mais que o ganho no groupby
+POLARS_MIN_ROWS = 50_000
+
+def _argtop_k(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Posições dos k maiores valores em ordem decrescente, empates na ordem de aparição
+    (como nlargest(keep='first')), com seleção parcial O(n) em vez de ordenar tudo.
+    """
+    n = len(values)
+    if k >= n:
+        return np.argsort(-values, kind='stable')
+    
+    kth = np.partition(values, n - k)[n - k]  # k-ésimo maior valor
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:k - len(above)]
+    top = np.sort(np.concatenate([above, ties]))
+    return top[np.argsort(-values[top], kind='stable')]
+
+def _top_k(values: pd.Series, k: int) -> pd.Series:
+    """Equivalente a nlargest(k) para Series sem nulos (contagens e somas agregadas)."""
+    return values.iloc[_argtop_k(values.to_numpy(), k)]
+
+def _top_group_sizes(df: pd.DataFrame, keys: list, k: int, name: str) -> pd.DataFrame:
+    """Equivalente a groupby(keys).size().nlargest(k), com Polars em bases grandes."""
+    if POLARS_AVAILABLE and len(df) >= POLARS_MIN_ROWS:
+        # Desempate pelas chaves em ordem crescente, como o nlargest sobre o groupby ordenado
+        top = (
+            pl.from_pandas(df[keys]).lazy()
+            .with_columns(pl.col(pl.Categorical).cast(pl.String))
+            .group_by(keys)
+            .agg(pl.len().alias(name))
+            .sort([name, *keys], descending=[True] + [False] * len(keys))
+            .head(k)
+            .collect()
+        )
+        return top.to_pandas()
+    
+    # Chaves ordenadas (códigos inteiros/category, barato): empates desempatados como no Polars
+    sizes = df.groupby(keys, observed=True).size()
+    return _top_k(sizes, k).reset_index(name=name)
+
+def _value_counts_top_k(values: pd.Series, k: int) -> pd.Series:
+    """Equivalente a value_counts().head(k) para uma Series category."""
+    if NUMBA_AVAILABLE and len(values) > NUMBA_MIN_ROWS:
+        categories = values.cat.categories
+        counts = _count_codes(values.cat.codes.to_numpy(), len(categories))
+        
+        k = min(k, int((counts > 0).sum()))
+        if k == 0:
+            return pd.Series(dtype='int64')
+        
+        # Seleção parcial O(n) seguida de ordenação apenas dos k escolhidos
+        top = _argtop_k(counts, k)
+        return pd.Series(counts[top], index=categories[top], name='count')
+    
+    # value_counts de category já conta os códigos (bincount); descartar as categorias
+    # sem ocorrência no resultado evita recodificar a coluna inteira
+    counts = values.value_counts(sort=False)
+    return _top_k(counts[counts > 0], k)
+
+def _keep_rows(df: pd.DataFrame, mask: np.ndarray) -> pd.DataFrame:
+    """Aplica a máscara; quando ela mantém todas as linhas (filtro já feito no servidor), devolve o próprio df sem cópia."""
+    return df if mask.all() else df[mask]
+
+def _municipality_top(df: pd.DataFrame) -> tuple:
+    """Top 10 municípios por nº de infrações; retorna (tabela, contagem_por_codigo)."""
+    # Uma única máscara e uma única seleção (só as colunas-chave), em vez de filtrar em cascata
+    mask = non_empty_mask(df['MUNICIPIO']) & non_empty_mask(df['UF'])
+    
+    # Método preferido: usar código do município se disponível
+    if 'COD_MUNICIPIO' in df.columns:
+        # Remove códigos vazios (na carga o código já vira inteiro; texto só no fallback)
+        mask &= non_empty_mask(df['COD_MUNICIPIO'])
+        keys = ['COD_MUNICIPIO', 'MUNICIPIO', 'UF']
+        return _top_group_sizes(df.loc[mask, keys], keys, 10, 'total_infracoes'), True
+    
+    # Fallback: usar nome do município
+    keys = ['MUNICIPIO', 'UF']
+    return _top_group_sizes(df.loc[mask, keys], keys, 10, 'total_infracoes'), False
+
+def _fine_by_type_totals(df: pd.DataFrame) -> pd.Series:
+    """Soma das multas por tipo de infração (Top 10)."""
+    # VAL_AUTO_INFRACAO_NUMERIC vem convertido da carga
+    mask = df['VAL_AUTO_INFRACAO_NUMERIC'].notna().to_numpy() & non_empty_mask(df['TIPO_INFRACAO'])
+    df_clean = df.loc[mask, ['TIPO_INFRACAO', 'VAL_AUTO_INFRACAO_NUMERIC']]
+    return _top_k(df_clean.groupby('TIPO_INFRACAO', observed=True)['VAL_AUTO_INFRACAO_NUMERIC'].sum(), 10)
+
+def _status_top(df: pd.DataFrame) -> pd.Series:
+    """Top 10 status do formulário por nº de infrações."""
+    # Trabalha sobre códigos inteiros (o paginador já entrega como category)
+    status = df['DES_STATUS_FORMULARIO'].dropna()
+    if status.dtype.name != 'category':
+        status = status.astype('category')
+    
+    # Remove valores vazios comparando só os códigos, sem varrer strings
+    status = status[status.values != '']
+    if status.empty:
+        return pd.Series(dtype='int64')
+    
+    return _value_counts_top_k(status, 10)
+
+def _offender_groups(df: pd.DataFrame):
+    """Top 10 pessoas físicas e empresas por valor de multa; None se não há registros válidos."""
+    mask = (
+        non_empty_mask(df['NOME_INFRATOR']) &
+        non_empty_mask(df['CPF_CNPJ_INFRATOR']) &
+        df['VAL_AUTO_INFRACAO_NUMERIC'].notna().to_numpy()
+    )
+    df_clean = df.loc[mask, ['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR', 'VAL_AUTO_INFRACAO_NUMERIC']]
+    if df_clean.empty:
+        return None
+    
+    # Classifica o documento pelo formato, de forma vetorizada:
+    # CPF = XXX.XXX.XXX-XX (14 caracteres) | CNPJ = XX.XXX.XXX/XXXX-XX (18 caracteres)
+    docs = df_clean['CPF_CNPJ_INFRATOR']
+    if not isinstance(docs.dtype, pd.StringDtype):
+        docs = docs.astype('string')
+    docs = docs.str.strip()
+    lengths = docs.str.len()
+    dots = docs.str.count(r'\.')
+    dashes = docs.str.count('-')
+    
+    is_cpf = (lengths.eq(14) & dots.eq(2) & dashes.eq(1)).fillna(False).astype(bool)
+    is_cnpj = (
+        lengths.eq(18) & dots.eq(2) & docs.str.count('/').eq(1) & dashes.eq(1)
+    ).fillna(False).astype(bool)
+
+    def _top(rows):
+        # Agrupa por NOME_INFRATOR e CPF_CNPJ_INFRATOR, soma os valores (dados já únicos POR SESSÃO)
+        # sort=False: o Top 10 dispensa ordenar milhares de pares (nome, documento)
+        grouped = rows.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'], sort=False)['VAL_AUTO_INFRACAO_NUMERIC'].sum()
+        return _top_k(grouped, 10).reset_index()
+    
+    return {
+        "pessoas_fisicas": _top(df_clean[is_cpf]),
+        "empresas": _top(df_clean[is_cnpj]),
+        "total_pf": int(is_cpf.sum()),
+        "total_empresas": int(is_cnpj.sum()),
+        "total_validos": len(df_clean)
+    }
+
+def _map_grid(df: pd.DataFrame) -> tuple:
+    """Grade de densidade do mapa; retorna (células, nº de pontos válidos)."""
+    # Coordenadas já chegam numéricas da carga: máscara numpy direta, sem dropna.
+    # Filtra primeiro e só depois promove a float64 (apenas as linhas válidas)
+    lat = df['NUM_LATITUDE_AUTO'].to_numpy(dtype=np.float32, na_value=np.nan)
+    lon = df['NUM_LONGITUDE_AUTO'].to_numpy(dtype=np.float32, na_value=np.nan)
+    if NUMBA_AVAILABLE and len(lat) > NUMBA_MIN_ROWS:
+        # Máscara, compactação e conversão fundidas num só laço
+        lat, lon = _compact_coords(lat, lon)
+    else:
+        bad = np.isnan(lat) | np.isnan(lon)
+        if bad.any():
+            lat, lon = lat[~bad], lon[~bad]
+        lat, lon = lat.astype(np.float64), lon.astype(np.float64)
+    
+    if len(lat) == 0:
+        return pd.DataFrame(columns=['lat', 'lon', 'count']), 0
+    
+    # Agrega todos os pontos em células da grade (O(N), sem amostragem);
+    # engrossa a grade até caber no limite de células enviado ao navegador
+    decimals = MAP_GRID_DECIMALS
+    cells = _bin_coordinates(lat, lon, decimals)
+    while len(cells) > MAP_MAX_CELLS and decimals > 0:
+        decimals -= 1
+        cells = _bin_coordinates(lat, lon, decimals)
+    return cells, len(lat)
+
+# Agregações puras (sem chamadas st.*): render_dashboard as calcula em paralelo
+CHART_AGGREGATIONS = {
+    'map': _map_grid,
+    'municipality': _municipality_top,
+    'fine_by_type': _fine_by_type_totals,
+    'status': _status_top,
+    'offenders': _offender_groups,
+}
+AGGREGATION_WORKERS = 8
+
+# Agregações no banco (métodos de DataVisualization) que render_dashboard dispara antes dos gráficos
+SQL_AGGREGATIONS = {
+    'overview': '_aggregate_overview',
+    'state': '_aggregate_states',
+    'municipality': '_aggregate_top_municipalities',
+    'fine_by_type': '_aggregate_fine_by_type',
+    'gravity': '_aggregate_gravity',
+    'status': '_aggregate_status',
+    'offenders': '_aggregate_top_offenders',
+}
+
+# Agregações usadas no diagnóstico de qualidade (uma única chamada a DataFrame.agg)
+QUALITY_AGGREGATIONS = {
+    'UF': ['nunique'],
+    'MUNICIPIO': ['nunique'],
+    'DAT_HORA_AUTO_INFRACAO': ['min', 'max']
+}
+
+# Colunas calculadas na carga (optimize_dtypes / _ensure_unique_data), fora da contagem de colunas da fonte
+DERIVED_COLUMNS = ['VAL_AUTO_INFRACAO_NUMERIC', 'DATE_PARSED', 'NUM_AI_CODE']
+
+def _date_filters_key(date_filters: dict) -> tuple:
+    """Converte o dicionário de filtros de data em uma chave hashable para cache."""
+    if date_filters.get("mode") == "simple":
+        return ("simple", tuple(sorted(date_filters.get("years", []))))
+    
+    periods = date_filters.get("periods", {})
+    return ("advanced", tuple(sorted((year, tuple(sorted(months))) for year, months in periods.items())))
+
+def _date_ranges(date_filters: dict):
+    """
+    Intervalos [início, fim) que cobrem exatamente os períodos selecionados, para o filtro no servidor.
+    Meses (ou anos) consecutivos são fundidos; None quando não há período.
+    """
+    if date_filters.get("mode") == "simple":
+        months = sorted(year * 12 + month for year in date_filters.get("years", []) for month in range(12))
+    else:
+        months = sorted(
+            year * 12 + month - 1
+            for year, selected in date_filters.get("periods", {}).items()
+            for month in selected
+        )
+    if not months:
+        return None
+    
+    def _first_day(index):
+        return f"{index // 12}-{index % 12 + 1:02d}-01"
+    
+    ranges = []
+    start = previous = months[0]
+    for index in months[1:]:
+        if index != previous + 1:
+            ranges.append((_first_day(start), _first_day(previous + 1)))
+            start = index
+        previous = index
+    ranges.append((_first_day(start), _first_day(previous + 1)))
+    return ranges
+
+def _sql_literal(value) -> str:
+    """Literal SQL com aspas simples escapadas (execute_query não aceita parâmetros)."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _where_clause(conditions: list) -> str:
+    """" WHERE a AND b ..." com as condições dadas, ou texto vazio se não houver nenhuma."""
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+def _sql_where(selected_ufs: list, date_filters: dict) -> str:
+    """WHERE portátil (DuckDB e Postgres) equivalente aos filtros de UF e período do pandas."""
+    id_text = 'CAST("NUM_AUTO_INFRACAO" AS VARCHAR)'
+    date_text = 'CAST("DAT_HORA_AUTO_INFRACAO" AS VARCHAR)'
+    conditions = [f"{id_text} IS NOT NULL", f"{id_text} <> ''"]
+    
+    if selected_ufs:
+        conditions.append(f'"UF" IN ({", ".join(_sql_literal(uf) for uf in selected_ufs)})')
+    
+    # Datas em texto ISO: ano (4 primeiros caracteres) ou ano-mês (7 primeiros)
+    if date_filters.get("mode") == "simple":
+        years = ", ".join(_sql_literal(year) for year in date_filters.get("years", []))
+        conditions.append(f"SUBSTR({date_text}, 1, 4) IN ({years or 'NULL'})")
+    else:
+        months = ", ".join(
+            _sql_literal(f"{year}-{month:02d}")
+            for year, year_months in date_filters.get("periods", {}).items()
+            for month in year_months
+        )
+        conditions.append(f"SUBSTR({date_text}, 1, 7) IN ({months or 'NULL'})")
+    
+    return _where_clause(conditions)
+
+def _deduped_source(where: str, columns: list) -> str:
+    """
+    Subconsulta com uma linha por NUM_AUTO_INFRACAO entre as linhas do `where` (filtra e depois
+    deduplica na ordem DEDUP_ORDER_SQL, como o _ensure_unique_data do pandas),
+    com `columns` e o valor numérico da multa (`valor`).
+    """
+    select = "".join(f'"{col}", ' for col in columns)
+    return f"""(
+        SELECT * FROM (
+            SELECT {select}{FINE_VALUE_SQL} AS valor,
+                ROW_NUMBER() OVER (PARTITION BY "NUM_AUTO_INFRACAO" ORDER BY {DEDUP_ORDER_SQL}) AS ocorrencia
+            FROM ibama_infracao{where}
+        ) AS numerados
+        WHERE ocorrencia = 1
+    ) AS unicos"""
+
+# Colunas disponíveis na tabela pré-agregada (Database.get_aggregate_source)
+AGGREGATE_COLUMNS = ['UF', 'COD_MUNICIPIO', 'MUNICIPIO', 'GRAVIDADE_INFRACAO', 'TIPO_INFRACAO', 'DES_STATUS_FORMULARIO']
+
+def _aggregate_where(selected_ufs: list, date_filters: dict) -> str:
+    """WHERE da tabela pré-agregada, cujas colunas ano / ano_mes já vêm extraídas da data."""
+    conditions = []
+    if selected_ufs:
+        conditions.append(f'"UF" IN ({", ".join(_sql_literal(uf) for uf in selected_ufs)})')
+    
+    if date_filters.get("mode") == "simple":
+        years = ", ".join(_sql_literal(year) for year in date_filters.get("years", []))
+        conditions.append(f"ano IN ({years or 'NULL'})")
+    else:
+        months = ", ".join(
+            _sql_literal(f"{year}-{month:02d}")
+            for year, year_months in date_filters.get("periods", {}).items()
+            for month in year_months
+        )
+        conditions.append(f"ano_mes IN ({months or 'NULL'})")
+    
+    return _where_clause(conditions)
+
+def _aggregate_source(aggregate_table: str, selected_ufs: list, date_filters: dict) -> str:
+    """
+    Subconsulta sobre a tabela pré-agregada (ver AGGREGATE_SELECT) já filtrada: as linhas prontas entram
+    direto; dos autos espalhados por várias células UF/mês fica só a primeira linha que passou no filtro.
+    """
+    where = _aggregate_where(selected_ufs, date_filters)
+    columns = ", ".join(f'"{col}"' for col in AGGREGATE_COLUMNS) + ", total, valor"
+    return f"""(
+        SELECT {columns} FROM {aggregate_table}{where} AND num IS NULL
+        UNION ALL
+        SELECT {columns} FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY num ORDER BY data_hora COLLATE "C", CAST("UF" AS VARCHAR) COLLATE "C" NULLS LAST
+            ) AS ocorrencia
+            FROM {aggregate_table}{where} AND num IS NOT NULL
+        ) AS espalhados
+        WHERE ocorrencia = 1
+    ) AS agregado"""
+
+@st.cache_data(ttl=DATA_CACHE_TTL, show_spinner=False)
+def _query_aggregate(_viz, sql: str):
+    """Executa (com cache pelo texto da consulta) uma agregação no banco; erros propagam e não entram no cache."""
+    if _viz.database.is_cloud:
+        # Mesma RPC usada por Database._execute_supabase_query
+        result = _viz.database.supabase.rpc('execute_raw_sql', {'sql_query': sql}).execute()
+        return pd.DataFrame(result.data) if result.data is not None else None
+    return _viz.database.connection.execute(sql).fetchdf()
+
+def _run_aggregate(_viz, sql: str):
+    """
+    Agregação no banco (ver _query_aggregate); None se indisponível, sem fixar a falha no cache.
+    Se a RPC do Supabase não existe, o Database guarda isso e as agregações seguintes vão direto ao pandas.
+    """
+    database = _viz.database
+    if database.is_cloud and not database.sql_rpc_available:
+        return None
+    try:
+        return _query_aggregate(_viz, sql)
+    except Exception as e:
+        if database.is_cloud and not is_sql_error(e):
+            database.sql_rpc_available = False
+            print(f"⚠️ RPC execute_raw_sql indisponível, agregações no pandas nesta sessão: {e}")
+        else:
+            print(f"⚠️ Agregação no banco indisponível, usando pandas: {e}")
+        return None
+
+@functools.lru_cache(maxsize=128)
+def _year_range_filters(year_range: tuple) -> MappingProxyType:
+    """Converte o year_range dos métodos legacy para o formato date_filters (somente leitura, compartilhado)."""
+    return MappingProxyType({
+        "mode": "simple",
+        "years": tuple(range(year_range[0], year_range[1] + 1)),
+        "year_range": year_range,
+        "description": f"{year_range[0]}-{year_range[1]}"
+    })
+
+@st.cache_resource(show_spinner=False)
+def _get_paginator(client_id: int, _client) -> SupabasePaginator:
+    """Paginador compartilhado por cliente Supabase (o cache de dados dele fica em st.session_state)."""
+    return SupabasePaginator(_client)
+
+@st.cache_resource(ttl=DATA_CACHE_TTL, max_entries=8, show_spinner=False)
+def _fetch_filtered(_viz, ufs_key: tuple, filters_key: tuple, columns_key: tuple, _date_filters: dict,
+                    required_key: tuple = None) -> pd.DataFrame:
+    """
+    Busca (com cache por filtros e colunas) os dados filtrados, reaproveitados entre reruns.
+    cache_resource devolve o mesmo DataFrame sem desserializá-lo a cada rerun: não alterar in-place.
+    """
+    return _viz._load_filtered_data_advanced(list(ufs_key), _date_filters, columns_key, required_key)
+
+def _data_key(data) -> str:
+    """Impressão digital do conteúdo agregado (Series/DataFrame pequenos) usada nas chaves de cache."""
+    return hashlib.blake2b(pd.util.hash_pandas_object(data).to_numpy(), digest_size=16).hexdigest()
+
+@st.cache_resource(ttl=DATA_CACHE_TTL, max_entries=64, show_spinner=False)
+def _build_figure(name: str, ufs_key: tuple, filters_key: tuple, data_key: str, _build) -> go.Figure:
+    """
+    Constrói (com cache por gráfico e filtros) uma figura Plotly; reruns reaproveitam o layout pronto.
+    cache_resource devolve o próprio objeto, sem o pickle/unpickle (e a revalidação do Plotly) do cache_data.
+    """
+    return _build()
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _build_map_html(ufs_key: tuple, filters_key: tuple, data_key: str, _df_map: pd.DataFrame) -> str:
+    """HTML do mapa de calor para estes filtros; reruns reaproveitam o deck já serializado."""
+    # O JSON do deck escreve cada float com todos os dígitos: arredondar encurta o payload
+    # (float32 não ajuda, pois vira float64 na serialização)
+    data = _df_map.round({'lat': MAP_COORD_DECIMALS, 'lon': MAP_COORD_DECIMALS})
+    
+    # Mapa de calor ponderado pela contagem de cada célula
+    layer = pdk.Layer(
+        'HeatmapLayer',
+        data=data,
+        get_position='[lon, lat]',
+        get_weight='count',
+        radius_pixels=30,
+        aggregation='SUM'
+    )
+    view_state = pdk.ViewState(latitude=-14, longitude=-55, zoom=3)
+    deck = pdk.Deck(layers=[layer], initial_view_state=view_state, map_style=pdk.map_styles.LIGHT)
+    return deck.to_html(as_string=True, notebook_display=False)
+
+@st.cache_data(ttl=DATA_CACHE_TTL, show_spinner=False)
+def _compute_data_quality_info(_viz, ufs_key: tuple, filters_key: tuple, _date_filters: dict) -> dict:
+    """Calcula (com cache por filtros) as informações de qualidade dos dados."""
+    # Só as colunas do diagnóstico: reaproveita os dados já carregados pelo painel
+    df = _viz._get_filtered_data_advanced(list(ufs_key), _date_filters, list(QUALITY_AGGREGATIONS))
+    
+    if df.empty:
+        return {"error": "Nenhum dado disponível nesta sessão"}
+    
+    # Uma única passada de agregação sobre as colunas disponíveis
+    aggregations = {col: funcs for col, funcs in QUALITY_AGGREGATIONS.items() if col in df.columns}
+    stats = df.agg(aggregations) if aggregations else pd.DataFrame()
+
+    def _stat(col, func, default=None):
+        if col not in stats.columns or func not in stats.index:
+            return default
+        value = stats.at[func, col]
+        return default if pd.isna(value) else value
+    
+    has_num_auto = 'NUM_AUTO_INFRACAO' in df.columns
+    total_records = len(df)
+    
+    # Um único hash da coluna de IDs fornece tanto os únicos quanto os nulos
+    unique_infractions = null_num_auto = 0
+    if has_num_auto:
+        id_counts = df['NUM_AUTO_INFRACAO'].value_counts(dropna=False)
+        null_rows = id_counts.index.isna()
+        null_num_auto = int(id_counts[null_rows].sum())
+        unique_infractions = len(id_counts) - int(null_rows.any())
+    
+    return {
+        "total_records": total_records,
+        "has_num_auto_infracao": has_num_auto,
+        "unique_infractions": unique_infractions,
+        "null_num_auto": null_num_auto,
+        "columns_count": sum(col not in DERIVED_COLUMNS for col in df.columns),
+        # Strings Arrow e category já informam o tamanho real dos buffers: sem deep=True (que percorre cada string)
+        "memory_usage_mb": df.memory_usage(index=True).sum() / 1024 / 1024,
+        "date_range": {
+            "min": _stat('DAT_HORA_AUTO_INFRACAO', 'min'),
+            "max": _stat('DAT_HORA_AUTO_INFRACAO', 'max')
+        },
+        "states_count": int(_stat('UF', 'nunique', 0)),
+        "municipalities_count": int(_stat('MUNICIPIO', 'nunique', 0))
+    }
 
 class DataVisualization:
     def __init__(self, database=None):
@@ -42,9 +615,16 @@ class DataVisualization:
         
         # Inicializa o paginador se estiver usando Supabase
         if database and database.is_cloud and database.supabase:
-            self.paginator = SupabasePaginator(database.supabase)
+            self.paginator = _get_paginator(id(database.supabase), database.supabase)
         else:
             self.paginator = None
+        
+        # Memo por renderização: os gráficos de uma mesma página reutilizam o mesmo DataFrame
+        self._render_cache = {}
+        # Agregações em andamento desta renderização: nome -> (DataFrame de origem, Future)
+        self._pending_aggregates = {}
+        # Agregações no banco já feitas nesta renderização: nome -> (chave dos filtros, resultado)
+        self._server_aggregates = {}
 
     def _ensure_unique_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -55,22 +635,28 @@ class DataVisualization:
             return df
         
         if 'NUM_AUTO_INFRACAO' in df.columns:
-            # Remove valores nulos primeiro
-            df_valid = df[df['NUM_AUTO_INFRACAO'].notna() & (df['NUM_AUTO_INFRACAO'] != '')]
-            
-            if not df_valid.empty:
-                # Verifica se há duplicatas
-                original_count = len(df_valid)
-                unique_count = df_valid['NUM_AUTO_INFRACAO'].nunique()
+            # Máscara de IDs válidos (não nulos e não vazios)
+            valid = non_empty_mask(df['NUM_AUTO_INFRACAO'])
+            original_count = int(valid.sum())
+            
+            if original_count > 0:
+                # Códigos inteiros do ID: contagens distintas seguintes não re-hasheiam strings.
+                # Nulos e vazios têm códigos próprios (-1 / ''), que a máscara já descarta.
+                # De cada ID repetido fica a mesma linha que o SQL manteria (DEDUP_ORDER_SQL)
+                codes = pd.factorize(df['NUM_AUTO_INFRACAO'])[0].astype('int32')
+                keep = first_infraction_mask(df, codes)
+                unique_count = int(keep.sum())
+                
+                # Uma única seleção de linhas para validade e duplicatas
+                df_unique = _keep_rows(df, keep).assign(NUM_AI_CODE=codes[keep])
                 
+                # Verifica se há duplicatas
                 if original_count != unique_count:
                     print(f"⚠️ DUPLICATAS DETECTADAS: {original_count} registros → {unique_count} únicos")
-                    df_unique = df_valid.drop_duplicates(subset=['NUM_AUTO_INFRACAO'], keep='first')
                     print(f"✅ DUPLICATAS REMOVIDAS: {len(df_unique)} registros finais")
-                    return df_unique
                 else:
                     print(f"✅ DADOS JÁ ÚNICOS: {original_count} registros únicos confirmados")
-                    return df_valid
+                return df_unique
             else:
                 print("⚠️ Nenhum NUM_AUTO_INFRACAO válido encontrado")
                 return pd.DataFrame()  # Retorna vazio se não há dados válidos
@@ -78,36 +664,108 @@ class DataVisualization:
             print("⚠️ Coluna NUM_AUTO_INFRACAO não encontrada - contagem pode estar incorreta")
             return df
 
-    def _get_filtered_data_advanced(self, selected_ufs: list, date_filters: dict) -> pd.DataFrame:
+    def _get_filtered_data_advanced(self, selected_ufs: list, date_filters: dict, columns: list = None,
+                                    required: list = None) -> pd.DataFrame:
+        """
+        Retorna os dados filtrados, reaproveitando o resultado já obtido nesta renderização.
+        columns=None busca todas as colunas; um resultado com mais colunas também serve.
+        required: colunas que precisam vir preenchidas (filtro enviado ao servidor/Parquet);
+        um resultado sem esse filtro também serve, pois os gráficos descartam os vazios.
+        """
+        if columns is not None:
+            # Chave canônica: qualquer subconjunto das colunas do painel busca o painel inteiro,
+            # então cada filtro ocupa uma única entrada de _fetch_filtered em vez de uma por gráfico
+            columns = set(BASE_COLUMNS).union(columns)
+            columns = tuple(DASHBOARD_COLUMNS) if columns <= set(DASHBOARD_COLUMNS) else tuple(sorted(columns))
+        required = tuple(sorted(required)) if required else ()
+        
+        # UFs ordenadas: a mesma seleção em outra ordem reaproveita o resultado filtrado
+        key = (tuple(sorted(selected_ufs or ())), _date_filters_key(date_filters))
+        cached = self._render_cache.get(key)
+        if cached is not None:
+            cached_columns, cached_required, df = cached
+            has_columns = cached_columns is None or (columns is not None and set(columns) <= set(cached_columns))
+            if has_columns and set(cached_required) <= set(required):
+                return df
+        
+        df = _fetch_filtered(self, key[0], key[1], columns, date_filters, required or None)
+        if df.empty:
+            # Não mantém em cache um resultado vazio (pode ser falha transitória da busca):
+            # descarta só a entrada destes argumentos, sem afetar o cache das outras sessões
+            _fetch_filtered.clear(self, key[0], key[1], columns, date_filters, required or None)
+        
+        self._render_cache[key] = (columns, required, df)
+        return df
+
+    def _load_filtered_data_advanced(self, selected_ufs: list, date_filters: dict, columns: tuple = None,
+                                     required: tuple = None) -> pd.DataFrame:
         """
         Obtém dados filtrados usando os novos filtros avançados de data.
-        CORRIGIDA: Usa cache por sessão individual.
+        Sem cache próprio: o resultado fica só em _fetch_filtered.
         """
         
+        # UF e os períodos exatos (intervalos de meses contíguos) vão para o servidor;
+        # o pandas só revalida as datas (texto inválido, fuso etc.)
+        date_ranges = _date_ranges(date_filters)
+        
         if self.paginator:
-            # Usa paginação para buscar todos os dados ÚNICOS POR SESSÃO
-            print("🔄 Usando paginação para buscar todos os dados únicos desta sessão...")
+            # Usa paginação para buscar todos os dados únicos
+            print("🔄 Usando paginação para buscar todos os dados únicos...")
             
-            # Gera cache key específico para estes filtros desta sessão
-            filter_str = f"ufs_{selected_ufs}_periods_{date_filters.get('periods', date_filters.get('years', []))}"
-            cache_key = self.paginator._get_session_key('ibama_infracao', filter_str)
-            
-            df = self.paginator.get_all_records('ibama_infracao', cache_key)
+            try:
+                # Sem a cópia em st.session_state: o DataFrame já fica em _fetch_filtered
+                df = self.paginator.get_all_records('ibama_infracao', None, selected_ufs, date_ranges, columns, required,
+                                                    cache_in_session=False)
+            except Exception as e:
+                # Busca incompleta (página indisponível): nada fica em cache, o próximo rerun tenta de novo
+                st.error(f"Erro ao obter dados: {e}")
+                return pd.DataFrame()
         else:
             # Fallback para método tradicional (DuckDB ou erro no Supabase)
             print("⚠️ Usando método tradicional (sem paginação)")
             try:
                 if self.database.is_cloud:
-                    # Tenta com limite alto
-                    result = self.database.supabase.table('ibama_infracao').select('*').limit(50000).execute()
-                    df = pd.DataFrame(result.data)
+                    # Tenta com limite alto, já filtrando no servidor
+                    query = self.database.supabase.table('ibama_infracao').select(','.join(columns) if columns else '*')
+                    if selected_ufs:
+                        query = query.in_('UF', list(selected_ufs))
+                    query = filter_date_ranges(query, date_ranges)
+                    for col in required or ():
+                        query = query.neq(col, '')
+                    result = query.limit(50000).execute()
+                    df = records_to_dataframe(result.data)
                 else:
-                    # DuckDB - usa query direta
-                    df = self.database.execute_query("SELECT * FROM ibama_infracao")
+                    # DuckDB - lê o Parquet particionado por UF; filtros e colunas descem para o scan
+                    conditions = []
+                    if selected_ufs:
+                        ufs_sql = ", ".join(_sql_literal(uf) for uf in selected_ufs)
+                        conditions.append(f"UF IN ({ufs_sql})")
+                    if date_ranges:
+                        conditions.append("(" + " OR ".join(
+                            f"(CAST(DAT_HORA_AUTO_INFRACAO AS VARCHAR) >= '{start}' "
+                            f"AND CAST(DAT_HORA_AUTO_INFRACAO AS VARCHAR) < '{end}')"
+                            for start, end in date_ranges
+                        ) + ")")
+                    # Colunas obrigatórias: linhas sem valor nem saem do scan do Parquet
+                    conditions.extend(
+                        f'"{col}" IS NOT NULL AND CAST("{col}" AS VARCHAR) <> \'\'' for col in required or ()
+                    )
+                    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+                    select_sql = ", ".join(f'"{col}"' for col in columns) if columns else "*"
+                    source = self.database.get_parquet_source()
+                    sql = f"SELECT {select_sql} FROM {source}{where}"
+                    if PYARROW_AVAILABLE:
+                        # Resultado colunar direto do DuckDB, sem a inferência de tipos do fetchdf
+                        df = arrow_to_pandas(self.database.connection.execute(sql).arrow())
+                    else:
+                        df = self.database.execute_query(sql)
                 
             except Exception as e:
                 st.error(f"Erro ao obter dados: {e}")
                 return pd.DataFrame()
+            
+            # O paginador já otimiza na carga; aqui os tipos são ajustados uma vez por busca
+            df = optimize_dtypes(df)
         
         # CRÍTICO: O paginador JÁ retorna dados únicos, mas valida por segurança
         df = self._ensure_unique_data(df)
@@ -118,9 +776,9 @@ class DataVisualization:
         
         print(f"✅ Base de dados carregada: {len(df):,} infrações únicas")
         
-        # Aplica filtro de UF
+        # Aplica filtro de UF (revalidação: o filtro já desceu para o servidor)
         if selected_ufs and 'UF' in df.columns:
-            df = df[df['UF'].isin(selected_ufs)]
+            df = _keep_rows(df, df['UF'].isin(selected_ufs).to_numpy())
             print(f"🗺️ Após filtro UF: {len(df):,} registros únicos")
         
         # Aplica filtros de data avançados
@@ -129,39 +787,266 @@ class DataVisualization:
         
         return df
 
+    def _count_sources(self, selected_ufs: list, date_filters: dict, columns: list) -> list:
+        """
+        Fontes já filtradas para contagens de infrações únicas, em ordem de preferência: (subconsulta, expressão).
+        A tabela pré-agregada soma contagens prontas; a tabela completa conta uma linha por auto de infração,
+        de modo que cada auto entra num único grupo, como no pandas.
+        """
+        sources = []
+        if set(columns) <= set(AGGREGATE_COLUMNS):
+            aggregate_table = self.database.get_aggregate_source()
+            if aggregate_table:
+                sources.append((_aggregate_source(aggregate_table, selected_ufs, date_filters), "CAST(SUM(total) AS BIGINT)"))
+        sources.append((_deduped_source(_sql_where(selected_ufs, date_filters), columns), "COUNT(*)"))
+        return sources
+
+    def _first_aggregate(self, queries: list, columns: set):
+        """
+        Executa as consultas em ordem de preferência (tabela pré-agregada antes da completa):
+        a seguinte só é tentada se a anterior falhar. Devolve o primeiro resultado com `columns`, ou None.
+        """
+        for sql in queries:
+            result = _run_aggregate(self, sql)
+            if result is not None and columns <= set(result.columns):
+                return result
+        return None
+
+    def _aggregate_counts(self, column: str, selected_ufs: list, date_filters: dict,
+                          limit: int = None, null_label: str = None):
+        """
+        Conta infrações únicas por valor de `column` com GROUP BY no banco.
+        Retorna Series ordenada (maior primeiro) ou None quando o banco não suporta a consulta.
+        """
+        if self.database is None:
+            return None
+        
+        if null_label is None:
+            group_expr = f'"{column}"'
+            where = _where_clause([f'"{column}" IS NOT NULL'])
+        else:
+            # Nulos e vazios entram num grupo próprio, como no fillna/replace do pandas
+            group_expr = f"COALESCE(NULLIF(CAST(\"{column}\" AS VARCHAR), ''), {_sql_literal(null_label)})"
+            where = ""
+        
+        limit_sql = f" LIMIT {int(limit)}" if limit else ""
+        queries = [
+            f"SELECT {group_expr} AS grupo, {count_expr} AS total "
+            f"FROM {source}{where} GROUP BY 1 ORDER BY total DESC{limit_sql}"
+            for source, count_expr in self._count_sources(selected_ufs, date_filters, [column])
+        ]
+        
+        result = self._first_aggregate(queries, {'grupo', 'total'})
+        if result is None:
+            return None
+        return pd.Series(result['total'].to_numpy(), index=result['grupo'].astype(str).to_numpy(), name='count')
+
+    def _aggregate_states(self, selected_ufs: list, date_filters: dict, k: int = 15):
+        """Top-k UFs por infrações únicas (GROUP BY no banco); None quando o banco não suporta a consulta."""
+        return self._aggregate_counts('UF', selected_ufs, date_filters, limit=k)
+
+    def _aggregate_gravity(self, selected_ufs: list, date_filters: dict):
+        """Infrações únicas por gravidade, nulos/vazios como "Sem avaliação feita"; None sem suporte no banco."""
+        return self._aggregate_counts('GRAVIDADE_INFRACAO', selected_ufs, date_filters, null_label='Sem avaliação feita')
+
+    def _aggregate_top_municipalities(self, selected_ufs: list, date_filters: dict, k: int = 10):
+        """
+        Top-k municípios (código IBGE, nome, UF) por infrações únicas, calculado no banco.
+        Retorna DataFrame como o de _municipality_top ou None quando o banco não suporta a consulta.
+        """
+        if self.database is None:
+            return None
+        
+        columns = ['COD_MUNICIPIO', 'MUNICIPIO', 'UF']
+        where = _where_clause([f'"{col}" IS NOT NULL AND CAST("{col}" AS VARCHAR) <> \'\'' for col in columns])
+        queries = [
+            f'SELECT "COD_MUNICIPIO", "MUNICIPIO", "UF", {count_expr} AS total_infracoes '
+            f"FROM {source}{where} GROUP BY 1, 2, 3 "
+            f"ORDER BY total_infracoes DESC, 1, 2, 3 LIMIT {int(k)}"
+            for source, count_expr in self._count_sources(selected_ufs, date_filters, columns)
+        ]
+        return self._first_aggregate(queries, {'MUNICIPIO', 'UF', 'total_infracoes'})
+
+    def _aggregate_fine_by_type(self, selected_ufs: list, date_filters: dict, k: int = 10):
+        """
+        Soma das multas por tipo (Top k) a partir da tabela pré-agregada.
+        Retorna Series como a de _fine_by_type_totals ou None quando a tabela não está disponível.
+        """
+        if self.database is None:
+            return None
+        
+        queries = []
+        aggregate_table = self.database.get_aggregate_source()
+        if aggregate_table:
+            queries.append(
+                'SELECT "TIPO_INFRACAO" AS grupo, SUM(valor) AS valor_total '
+                f"FROM {_aggregate_source(aggregate_table, selected_ufs, date_filters)}"
+                ' WHERE "TIPO_INFRACAO" IS NOT NULL AND CAST("TIPO_INFRACAO" AS VARCHAR) <> \'\''
+                f" GROUP BY 1 HAVING SUM(valor) IS NOT NULL ORDER BY valor_total DESC, 1 LIMIT {int(k)}"
+            )
+        # Tabela completa: soma uma linha por auto de infração
+        queries.append(
+            'SELECT "TIPO_INFRACAO" AS grupo, SUM(valor) AS valor_total '
+            f'FROM {_deduped_source(_sql_where(selected_ufs, date_filters), ["TIPO_INFRACAO"])} '
+            'WHERE "TIPO_INFRACAO" IS NOT NULL AND CAST("TIPO_INFRACAO" AS VARCHAR) <> \'\' AND valor IS NOT NULL '
+            f"GROUP BY 1 ORDER BY valor_total DESC, 1 LIMIT {int(k)}"
+        )
+        
+        result = self._first_aggregate(queries, {'grupo', 'valor_total'})
+        if result is None:
+            return None
+        return pd.Series(result['valor_total'].astype('float64').to_numpy(), index=result['grupo'].astype(str).to_numpy())
+
+    def _aggregate_status(self, selected_ufs: list, date_filters: dict, k: int = 10):
+        """
+        Top-k status do formulário com GROUP BY no banco; o title case (que funde variantes
+        de caixa, como na carga) é aplicado ao resultado, que tem só um punhado de linhas.
+        Retorna Series como a de _status_top ou None quando o banco não suporta a consulta.
+        """
+        counts = self._aggregate_counts('DES_STATUS_FORMULARIO', selected_ufs, date_filters)
+        if counts is None:
+            return None
+        
+        counts = counts[counts.index != '']
+        titled = counts.groupby(counts.index.str.title(), sort=False).sum()
+        return _top_k(titled, k)
+
+    def _aggregate_overview(self, selected_ufs: list, date_filters: dict):
+        """
+        (infrações únicas, valor total das multas, municípios distintos) numa única consulta ao banco.
+        Retorna None quando o banco não suporta a consulta.
+        """
+        if self.database is None:
+            return None
+        
+        municipios = 'COUNT(DISTINCT NULLIF(CAST("COD_MUNICIPIO" AS VARCHAR), \'\'))'
+        queries = []
+        aggregate_table = self.database.get_aggregate_source()
+        if aggregate_table:
+            queries.append(
+                f"SELECT CAST(SUM(total) AS BIGINT) AS total, SUM(valor) AS valor, {municipios} AS municipios "
+                f"FROM {_aggregate_source(aggregate_table, selected_ufs, date_filters)}"
+            )
+        # Tabela completa: uma linha por auto de infração
+        queries.append(
+            f"SELECT COUNT(*) AS total, SUM(valor) AS valor, {municipios} AS municipios "
+            f'FROM {_deduped_source(_sql_where(selected_ufs, date_filters), ["COD_MUNICIPIO"])}'
+        )
+        
+        result = self._first_aggregate(queries, {'total', 'valor', 'municipios'})
+        if result is None or len(result) != 1:
+            return None
+        
+        row = result.iloc[0]
+        total = int(row['total']) if pd.notna(row['total']) else 0
+        valor = float(row['valor']) if pd.notna(row['valor']) else 0.0
+        municipios_count = int(row['municipios']) if pd.notna(row['municipios']) else 0
+        return total, valor, municipios_count
+
+    def _aggregate_top_offenders(self, selected_ufs: list, date_filters: dict, k: int = 10):
+        """
+        Top-k pessoas físicas e empresas por valor de multa, com a classificação CPF/CNPJ no SQL.
+        Retorna o mesmo dicionário de _offender_groups ou None quando o banco não suporta a consulta.
+        """
+        if self.database is None:
+            return None
+        
+        doc = 'TRIM(CAST("CPF_CNPJ_INFRATOR" AS VARCHAR))'
+        source = _deduped_source(_sql_where(selected_ufs, date_filters), ['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])
+        
+        # Mesmo critério do pandas: CPF = XXX.XXX.XXX-XX (14) | CNPJ = XX.XXX.XXX/XXXX-XX (18)
+        def _count(char):
+            return f"(LENGTH(doc) - LENGTH(REPLACE(doc, '{char}', '')))"
+        
+        sql = f"""
+            WITH docs AS (
+                SELECT "NOME_INFRATOR" AS nome, "CPF_CNPJ_INFRATOR" AS documento, {doc} AS doc, valor
+                FROM {source}
+                WHERE "NOME_INFRATOR" IS NOT NULL AND CAST("NOME_INFRATOR" AS VARCHAR) <> ''
+                    AND "CPF_CNPJ_INFRATOR" IS NOT NULL AND CAST("CPF_CNPJ_INFRATOR" AS VARCHAR) <> ''
+            ), classified AS (
+                SELECT nome, documento, valor,
+                    CASE
+                        WHEN LENGTH(doc) = 14 AND {_count('.')} = 2 AND {_count('-')} = 1 THEN 'pf'
+                        WHEN LENGTH(doc) = 18 AND {_count('.')} = 2 AND {_count('/')} = 1 AND {_count('-')} = 1 THEN 'pj'
+                        ELSE 'outro'
+                    END AS tipo
+                FROM docs WHERE valor IS NOT NULL
+            ), grouped AS (
+                SELECT tipo, nome, documento, SUM(valor) AS total, COUNT(*) AS registros
+                FROM classified GROUP BY 1, 2, 3
+            ), ranked AS (
+                SELECT tipo, nome, documento, total,
+                    SUM(registros) OVER (PARTITION BY tipo) AS registros_tipo,
+                    ROW_NUMBER() OVER (PARTITION BY tipo ORDER BY total DESC, nome, documento) AS posicao
+                FROM grouped
+            )
+            SELECT tipo, nome, documento, total, registros_tipo FROM ranked
+            WHERE posicao <= CASE WHEN tipo = 'outro' THEN 1 ELSE {int(k)} END  -- formato não identificado: só a contagem
+        """
+        
+        result = _run_aggregate(self, sql)
+        if result is None or not {'tipo', 'nome', 'documento', 'total', 'registros_tipo'} <= set(result.columns):
+            return None
+
+        def _top(tipo):
+            rows = result[result['tipo'] == tipo]
+            top = pd.DataFrame({
+                'NOME_INFRATOR': rows['nome'].to_numpy(),
+                'CPF_CNPJ_INFRATOR': rows['documento'].to_numpy(),
+                'VAL_AUTO_INFRACAO_NUMERIC': rows['total'].astype('float64').to_numpy()
+            })
+            return top, int(rows['registros_tipo'].iloc[0]) if not rows.empty else 0
+        
+        pessoas_fisicas, total_pf = _top('pf')
+        empresas, total_empresas = _top('pj')
+        _, total_outros = _top('outro')
+        
+        return {
+            "pessoas_fisicas": pessoas_fisicas,
+            "empresas": empresas,
+            "total_pf": total_pf,
+            "total_empresas": total_empresas,
+            "total_validos": total_pf + total_empresas + total_outros
+        }
+
     def _apply_date_filter_to_dataframe(self, df: pd.DataFrame, date_filters: dict) -> pd.DataFrame:
         """Aplica filtros de data ao DataFrame."""
         if df.empty or 'DAT_HORA_AUTO_INFRACAO' not in df.columns:
             return df
         
         try:
-            # Converte coluna de data
-            df['DATE_PARSED'] = pd.to_datetime(df['DAT_HORA_AUTO_INFRACAO'], errors='coerce')
-            df_with_date = df[df['DATE_PARSED'].notna()].copy()
+            # A data normalmente já vem convertida da carga (optimize_dtypes)
+            if 'DATE_PARSED' not in df.columns:
+                df['DATE_PARSED'] = pd.to_datetime(df['DAT_HORA_AUTO_INFRACAO'], format='ISO8601', errors='coerce')
+            # Uma única seleção no final: sem cópia intermediária das linhas com data válida
+            dates = df['DATE_PARSED']
+            if isinstance(dates.dtype, pd.DatetimeTZDtype):
+                dates = dates.dt.tz_localize(None)  # mantém a data/hora local
+            
+            # Uma só conversão para meses numpy (datetime64[M]) fornece ano e mês,
+            # em vez de dois acessores .dt que percorrem a coluna separadamente
+            months = dates.to_numpy().astype('datetime64[M]')
+            has_date = ~np.isnat(months)
+            
+            if not has_date.any():
+                return df.iloc[0:0]
             
-            if df_with_date.empty:
-                return df_with_date
+            # Índice absoluto do mês: ano * 12 + (mês - 1)
+            month_index = months.astype(np.int64) + 1970 * 12
             
             if date_filters["mode"] == "simple":
                 # Filtro simples por anos
-                mask = df_with_date['DATE_PARSED'].dt.year.isin(date_filters["years"])
-                return df_with_date[mask]
+                mask = has_date & np.isin(month_index // 12, np.asarray(list(date_filters["years"])))
+                return _keep_rows(df, mask)
             
             else:
-                # Filtro avançado por períodos
-                masks = []
-                for year, months in date_filters["periods"].items():
-                    year_mask = df_with_date['DATE_PARSED'].dt.year == year
-                    month_mask = df_with_date['DATE_PARSED'].dt.month.isin(months)
-                    masks.append(year_mask & month_mask)
-                
-                if masks:
-                    final_mask = masks[0]
-                    for mask in masks[1:]:
-                        final_mask = final_mask | mask
-                    return df_with_date[final_mask]
-                else:
+                # Filtro avançado: índice do mês testado numa única passada contra os períodos
+                valid_keys = [year * 12 + month - 1 for year, months_sel in date_filters["periods"].items() for month in months_sel]
+                if not valid_keys:
                     return pd.DataFrame()
+                
+                return _keep_rows(df, has_date & np.isin(month_index, valid_keys))
         
         except Exception as e:
             st.error(f"Erro ao aplicar filtro de data: {e}")
@@ -169,54 +1054,136 @@ class DataVisualization:
 
     # ======================== MÉTODOS AVANÇADOS CORRIGIDOS ========================
 
-    def create_overview_metrics_advanced(self, selected_ufs: list, date_filters: dict):
+    def render_dashboard(self, selected_ufs: list, date_filters: dict):
+        """Renderiza todos os gráficos do dashboard a partir de uma única busca de dados."""
+        # Nova renderização: descarta os dados memorizados na anterior
+        self._render_cache.clear()
+        self._pending_aggregates.clear()
+        self._server_aggregates.clear()
+        
+        # Uma busca com a união das colunas, repassada a cada gráfico
+        df = self._get_filtered_data_advanced(selected_ufs, date_filters, DASHBOARD_COLUMNS)
+        if df.empty:
+            # Sem linhas nos filtros: nenhum gráfico teria o que mostrar, nem as agregações no banco
+            st.warning("Nenhum dado encontrado para os filtros selecionados.")
+            return
+        
+        # Agregações resolvidas no banco dispensam a versão pandas; os gráficos reutilizam o resultado
+        # (também quando a consulta falhou, sem repeti-la na mesma renderização)
+        sql_aggregates = {name: getattr(self, method) for name, method in SQL_AGGREGATIONS.items()}
+        filters_key = (tuple(sorted(selected_ufs or ())), _date_filters_key(date_filters))
+        
+        # As agregações (pandas/polars puros) rodam em threads; o Streamlit só é chamado na thread principal.
+        # As threads herdam o contexto da sessão para poderem usar os caches (st.cache_data)
+        ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(max_workers=AGGREGATION_WORKERS, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+            if self.database is not None and self.database.is_cloud:
+                # Supabase: cada agregação é uma ida e volta RPC independente, então são disparadas juntas
+                futures = {name: executor.submit(func, selected_ufs, date_filters) for name, func in sql_aggregates.items()}
+                results = {name: future.result() for name, future in futures.items()}
+            else:
+                # DuckDB: sequencial de propósito. A conexão não pode ser usada por várias threads ao mesmo tempo,
+                # e um cursor() por thread não enxerga a tabela temporária ibama_agg desta conexão
+                results = {name: func(selected_ufs, date_filters) for name, func in sql_aggregates.items()}
+            self._server_aggregates = {name: (filters_key, result) for name, result in results.items()}
+            server_side = {name for name, result in results.items() if result is not None}
+            
+            for name, func in CHART_AGGREGATIONS.items():
+                if name not in server_side and set(CHART_COLUMNS[name]) <= set(df.columns):
+                    self._pending_aggregates[name] = (df, executor.submit(func, df))
+            
+            try:
+                self.create_overview_metrics_advanced(selected_ufs, date_filters, df)
+                st.divider()
+                self.create_infraction_map_advanced(selected_ufs, date_filters, df)
+                st.divider()
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    self.create_municipality_hotspots_chart_advanced(selected_ufs, date_filters, df)
+                    self.create_fine_value_by_type_chart_advanced(selected_ufs, date_filters, df)
+                    self.create_gravity_distribution_chart_advanced(selected_ufs, date_filters, df)
+                with col2:
+                    self.create_state_distribution_chart_advanced(selected_ufs, date_filters, df)
+                    self.create_infraction_status_chart_advanced(selected_ufs, date_filters, df)
+                    self.create_main_offenders_chart_advanced(selected_ufs, date_filters, df)
+            finally:
+                self._pending_aggregates.clear()
+                self._server_aggregates.clear()
+
+    def _cached_figure(self, name: str, selected_ufs: list, date_filters: dict, data, build) -> go.Figure:
+        """
+        Figura do gráfico para estes filtros e dados; build() só roda quando não há figura em cache.
+        A impressão digital dos dados agregados evita reaproveitar uma figura de antes de uma recarga.
+        """
+        return _build_figure(name, tuple(sorted(selected_ufs or ())), _date_filters_key(date_filters), _data_key(data), build)
+
+    def _server_aggregate(self, name: str, selected_ufs: list, date_filters: dict):
+        """Resultado da agregação no banco já feita por render_dashboard para estes filtros, ou consultada na hora."""
+        stored = self._server_aggregates.get(name)
+        if stored is not None and stored[0] == (tuple(sorted(selected_ufs or ())), _date_filters_key(date_filters)):
+            return stored[1]
+        return getattr(self, SQL_AGGREGATIONS[name])(selected_ufs, date_filters)
+
+    def _chart_aggregate(self, name: str, df: pd.DataFrame):
+        """Resultado da agregação já disparada por render_dashboard para este df, ou calculada na hora."""
+        pending = self._pending_aggregates.get(name)
+        if pending is not None and pending[0] is df:
+            return pending[1].result()
+        return CHART_AGGREGATIONS[name](df)
+
+    def create_overview_metrics_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria as métricas de visão geral usando dados únicos garantidos POR SESSÃO."""
         if not self.database:
             st.warning("Banco de dados não disponível.")
             return
 
         try:
-            with st.spinner("Carregando dados únicos desta sessão..."):
-                df = self._get_filtered_data_advanced(selected_ufs, date_filters)
-            
-            if df.empty:
-                st.warning("Nenhum dado encontrado para os filtros selecionados.")
-                return
-
-            # Dados já são únicos POR SESSÃO (garantido pelo _ensure_unique_data)
-            total_infracoes = len(df)
+            # Totais calculados no banco (poucas linhas trafegam); sem suporte, sobre os dados carregados
+            overview = self._server_aggregate('overview', selected_ufs, date_filters)
             metric_note = "infrações únicas desta sessão"
             
-            # Debug: Verifica se realmente não há duplicatas
-            if 'NUM_AUTO_INFRACAO' in df.columns:
-                unique_count = df['NUM_AUTO_INFRACAO'].nunique()
-                if unique_count != total_infracoes:
-                    print(f"🚨 ERRO CRÍTICO: Ainda há duplicatas! {total_infracoes} registros vs {unique_count} únicos")
-                    # Força correção emergencial
-                    df = df.drop_duplicates(subset=['NUM_AUTO_INFRACAO'], keep='first')
-                    total_infracoes = len(df)
-                    st.warning(f"⚠️ Duplicatas corrigidas automaticamente: {total_infracoes} infrações únicas")
-            
-            # Valor total das multas
-            try:
-                df['VAL_AUTO_INFRACAO_NUMERIC'] = pd.to_numeric(
-                    df['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.'), 
-                    errors='coerce'
-                )
-                valor_total_multas = df['VAL_AUTO_INFRACAO_NUMERIC'].sum()
-                if np.isnan(valor_total_multas):
-                    valor_total_multas = 0
-            except:
-                valor_total_multas = 0
-            
-            # Total de municípios - USA COD_MUNICIPIO para maior precisão
-            if 'COD_MUNICIPIO' in df.columns:
-                total_municipios = df['COD_MUNICIPIO'].nunique()
-            elif 'MUNICIPIO' in df.columns:
-                # Fallback para nome se código não estiver disponível
-                total_municipios = df['MUNICIPIO'].nunique()
+            if overview is not None:
+                total_infracoes, valor_total_multas, total_municipios = overview
+                if total_infracoes == 0:
+                    st.warning("Nenhum dado encontrado para os filtros selecionados.")
+                    return
             else:
-                total_municipios = 0
+                with st.spinner("Carregando dados únicos desta sessão..."):
+                    if df is None:
+                        df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['overview'])
+                
+                if len(df.index) == 0:
+                    st.warning("Nenhum dado encontrado para os filtros selecionados.")
+                    return
+                
+                # Dados já são únicos POR SESSÃO (garantido pelo _ensure_unique_data)
+                total_infracoes = len(df)
+            
+                # Debug: Verifica se realmente não há duplicatas. NUM_AI_CODE só existe em dados que
+                # passaram por _ensure_unique_data (já deduplicados), então a passada extra é dispensada
+                if 'NUM_AUTO_INFRACAO' in df.columns and 'NUM_AI_CODE' not in df.columns:
+                    unique_count = len(pd.unique(df['NUM_AUTO_INFRACAO'].to_numpy()))
+                    if unique_count != total_infracoes:
+                        print(f"🚨 ERRO CRÍTICO: Ainda há duplicatas! {total_infracoes} registros vs {unique_count} únicos")
+                        # Força correção emergencial
+                        df = df.drop_duplicates(subset=['NUM_AUTO_INFRACAO'], keep='first')
+                        total_infracoes = len(df)
+                        st.warning(f"⚠️ Duplicatas corrigidas automaticamente: {total_infracoes} infrações únicas")
+                
+                # Valor total das multas (já convertido na carga por optimize_dtypes; sum ignora NaN)
+                valor_total_multas = 0.0
+                if 'VAL_AUTO_INFRACAO_NUMERIC' in df.columns:
+                    valor_total_multas = float(df['VAL_AUTO_INFRACAO_NUMERIC'].sum())
+            
+                # Total de municípios - USA COD_MUNICIPIO para maior precisão
+                if 'COD_MUNICIPIO' in df.columns:
+                    total_municipios = _count_distinct(df['COD_MUNICIPIO'])
+                elif 'MUNICIPIO' in df.columns:
+                    # Fallback para nome se código não estiver disponível
+                    total_municipios = _count_distinct(df['MUNICIPIO'])
+                else:
+                    total_municipios = 0
 
             # Exibe métricas
             col1, col2, col3 = st.columns(3)
@@ -230,331 +1197,271 @@ class DataVisualization:
         except Exception as e:
             st.error(f"Erro ao calcular métricas: {e}")
 
-    def create_state_distribution_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_state_distribution_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráfico de distribuição por estado com dados únicos garantidos POR SESSÃO."""
+        # Espaço único reaproveitado pelo aviso, erro ou gráfico: menos nós inseridos/removidos a cada rerun
+        slot = st.empty()
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
+            # GROUP BY no banco; sem suporte, conta sobre os dados já carregados
+            uf_counts = self._server_aggregate('state', selected_ufs, date_filters)
             
-            if df.empty or 'UF' not in df.columns:
-                st.warning("Dados de UF não disponíveis.")
-                return
+            if uf_counts is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['state'])
+                
+                if len(df.index) == 0 or 'UF' not in df.columns:
+                    slot.warning("Dados de UF não disponíveis.")
+                    return
+                
+                # Distintos por UF sobre os códigos inteiros do ID (observed=True ignora UFs sem registros)
+                id_column = 'NUM_AI_CODE' if 'NUM_AI_CODE' in df.columns else 'NUM_AUTO_INFRACAO'
+                uf_counts = (
+                    df[['UF', id_column]].drop_duplicates()
+                    .groupby('UF', observed=True, sort=False).size()
+                    .pipe(_top_k, 15)
+                )
             
-            # Dados já são únicos POR SESSÃO, apenas conta por UF
-            uf_counts = df['UF'].value_counts().head(15)
             method_note = "infrações únicas desta sessão"
             
             if not uf_counts.empty:
-                chart_df = pd.DataFrame({
-                    'UF': uf_counts.index,
-                    'total': uf_counts.values
-                })
-                
-                fig = px.bar(
-                    chart_df, 
-                    x='UF', 
-                    y='total', 
-                    title="<b>Distribuição de Infrações por Estado</b>", 
-                    color='total',
-                    labels={'UF': 'Estado', 'total': f'Nº de Infrações ({method_note})'}
-                )
-                
-                # Adiciona nota sobre método
-                fig.add_annotation(
-                    text=f"* Contagem: {method_note}",
-                    xref="paper", yref="paper",
-                    x=1, y=1.02, xanchor='right', yanchor='bottom',
-                    showarrow=False,
-                    font=dict(size=10, color="gray")
-                )
+                def build_fig():
+                    chart_df = uf_counts.rename_axis('UF').reset_index(name='total')
+                    
+                    fig = _px().bar(
+                        chart_df, 
+                        x='UF', 
+                        y='total', 
+                        title="<b>Distribuição de Infrações por Estado</b>", 
+                        color='total',
+                        labels={'UF': 'Estado', 'total': f'Nº de Infrações ({method_note})'}
+                    )
+                    
+                    # Adiciona nota sobre método
+                    fig.add_annotation(
+                        text=f"* Contagem: {method_note}",
+                        xref="paper", yref="paper",
+                        x=1, y=1.02, xanchor='right', yanchor='bottom',
+                        showarrow=False,
+                        font=dict(size=10, color="gray")
+                    )
+                    
+                    return fig
                 
-                st.plotly_chart(fig, use_container_width=True)
+                fig = self._cached_figure('state', selected_ufs, date_filters, uf_counts, build_fig)
+                slot.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
                 
         except Exception as e:
-            st.error(f"Erro no gráfico de estados: {e}")
+            slot.error(f"Erro no gráfico de estados: {e}")
 
-    def create_municipality_hotspots_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_municipality_hotspots_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráfico dos municípios com mais infrações usando dados únicos garantidos POR SESSÃO."""
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
-            
-            if df.empty:
-                st.warning("Dados não disponíveis.")
-                return
-            
-            # Verifica se temos os campos necessários
-            required_fields = ['MUNICIPIO', 'UF']
-            if not all(field in df.columns for field in required_fields):
-                st.warning("Campos necessários para análise de municípios não encontrados.")
-                return
+            # Top 10 no banco (só 10 linhas trafegam); sem suporte, agrega sobre os dados carregados
+            muni_counts, by_code = self._server_aggregate('municipality', selected_ufs, date_filters), True
             
-            # Remove valores vazios nos campos necessários
-            df_clean = df[
-                df['MUNICIPIO'].notna() & 
-                df['UF'].notna() &
-                (df['MUNICIPIO'] != '') & 
-                (df['UF'] != '')
-            ].copy()
-            
-            if df_clean.empty:
-                st.warning("Dados válidos não disponíveis após limpeza.")
-                return
-            
-            # Método preferido: usar código do município se disponível
-            if 'COD_MUNICIPIO' in df.columns:
-                # Remove códigos vazios
-                df_clean = df_clean[
-                    df_clean['COD_MUNICIPIO'].notna() & 
-                    (df_clean['COD_MUNICIPIO'] != '')
-                ]
+            if muni_counts is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['municipality'])
                 
-                if df_clean.empty:
-                    st.warning("Códigos de município não disponíveis.")
+                if len(df.index) == 0:
+                    st.warning("Dados não disponíveis.")
                     return
                 
-                # Conta infrações por código do município (dados já são únicos POR SESSÃO)
-                muni_counts = df_clean.groupby(['COD_MUNICIPIO', 'MUNICIPIO', 'UF']).size().reset_index(name='total_infracoes')
-                muni_counts = muni_counts.nlargest(10, 'total_infracoes')
+                # Verifica se temos os campos necessários
+                required_fields = ['MUNICIPIO', 'UF']
+                if not all(field in df.columns for field in required_fields):
+                    st.warning("Campos necessários para análise de municípios não encontrados.")
+                    return
                 
+                # Conta infrações por código IBGE (ou por nome, sem o código); dados já são únicos POR SESSÃO
+                muni_counts, by_code = self._chart_aggregate('municipality', df)
+            
+            if by_code:
                 method_note = "* Contagem por código IBGE (infrações únicas desta sessão)"
-                
             else:
-                # Fallback: usar nome do município
                 st.caption("⚠️ Usando nomes de municípios (podem haver inconsistências)")
-                
-                # Conta infrações por nome do município (dados já são únicos POR SESSÃO)
-                muni_counts = df_clean.groupby(['MUNICIPIO', 'UF']).size().reset_index(name='total_infracoes')
-                muni_counts = muni_counts.nlargest(10, 'total_infracoes')
-                
                 method_note = "* Contagem por nome (infrações únicas desta sessão)"
             
             if not muni_counts.empty:
-                # Cria label combinado para exibição
-                muni_counts['local'] = muni_counts['MUNICIPIO'].str.title() + ' (' + muni_counts['UF'] + ')'
-                
-                fig = px.bar(
-                    muni_counts.sort_values('total_infracoes'), 
-                    y='local', 
-                    x='total_infracoes', 
-                    orientation='h',
-                    title="<b>Top 10 Municípios com Mais Infrações</b>",
-                    labels={'local': 'Município', 'total_infracoes': 'Nº de Infrações Únicas'},
-                    text='total_infracoes'
-                )
-                
-                # Adiciona informação sobre o método usado
-                fig.add_annotation(
-                    text=method_note,
-                    xref="paper", yref="paper",
-                    x=1, y=-0.1, xanchor='right', yanchor='top',
-                    showarrow=False,
-                    font=dict(size=10, color="gray")
-                )
+                def build_fig():
+                    # Cria label combinado para exibição
+                    muni_counts['local'] = muni_counts['MUNICIPIO'].astype(str).str.title() + ' (' + muni_counts['UF'].astype(str) + ')'
+                    
+                    fig = _px().bar(
+                        muni_counts.sort_values('total_infracoes'), 
+                        y='local', 
+                        x='total_infracoes', 
+                        orientation='h',
+                        title="<b>Top 10 Municípios com Mais Infrações</b>",
+                        labels={'local': 'Município', 'total_infracoes': 'Nº de Infrações Únicas'},
+                        text='total_infracoes'
+                    )
+                    
+                    # Adiciona informação sobre o método usado
+                    fig.add_annotation(
+                        text=method_note,
+                        xref="paper", yref="paper",
+                        x=1, y=-0.1, xanchor='right', yanchor='top',
+                        showarrow=False,
+                        font=dict(size=10, color="gray")
+                    )
+                    
+                    return fig
                 
-                st.plotly_chart(fig, use_container_width=True)
+                fig = self._cached_figure('municipality', selected_ufs, date_filters, muni_counts, build_fig)
+                st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+            else:
+                st.warning("Dados válidos não disponíveis após limpeza.")
                 
         except Exception as e:
             st.error(f"Erro no gráfico de municípios: {e}")
 
-    def create_fine_value_by_type_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_fine_value_by_type_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráfico de valores de multa por tipo com dados únicos garantidos POR SESSÃO."""
+        slot = st.empty()
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
-            
-            if df.empty or 'TIPO_INFRACAO' not in df.columns:
-                return
-            
-            # Converte valores
-            df['VAL_AUTO_INFRACAO_NUMERIC'] = pd.to_numeric(
-                df['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.'), 
-                errors='coerce'
-            )
-            
-            # Remove valores inválidos
-            df_clean = df[
-                df['VAL_AUTO_INFRACAO_NUMERIC'].notna() & 
-                df['TIPO_INFRACAO'].notna() & 
-                (df['TIPO_INFRACAO'] != '')
-            ]
+            # Soma pronta na tabela pré-agregada; sem ela, agrupa os dados carregados
+            type_values = self._server_aggregate('fine_by_type', selected_ufs, date_filters)
             
-            if df_clean.empty:
-                return
-            
-            # Agrupa por tipo (dados já são únicos POR SESSÃO)
-            type_values = df_clean.groupby('TIPO_INFRACAO')['VAL_AUTO_INFRACAO_NUMERIC'].sum().nlargest(10)
+            if type_values is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['fine_by_type'])
+                
+                if len(df.index) == 0 or 'TIPO_INFRACAO' not in df.columns:
+                    return
+                
+                # Agrupa por tipo (dados já são únicos POR SESSÃO)
+                type_values = self._chart_aggregate('fine_by_type', df)
             
             if not type_values.empty:
-                chart_df = pd.DataFrame({
-                    'TIPO_INFRACAO': type_values.index,
-                    'valor_total': type_values.values
-                })
-                
-                chart_df['TIPO_INFRACAO'] = chart_df['TIPO_INFRACAO'].str.title()
-                
-                fig = px.bar(
-                    chart_df.sort_values('valor_total'), 
-                    y='TIPO_INFRACAO', 
-                    x='valor_total', 
-                    orientation='h',
-                    title="<b>Tipos de Infração por Valor de Multa (Top 10)</b>"
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                def build_fig():
+                    chart_df = type_values.rename_axis('TIPO_INFRACAO').reset_index(name='valor_total')
+                    
+                    chart_df['TIPO_INFRACAO'] = chart_df['TIPO_INFRACAO'].str.title()
+                    
+                    fig = _px().bar(
+                        chart_df.sort_values('valor_total'), 
+                        y='TIPO_INFRACAO', 
+                        x='valor_total', 
+                        orientation='h',
+                        title="<b>Tipos de Infração por Valor de Multa (Top 10)</b>"
+                    )
+                    
+                    return fig
+                
+                fig = self._cached_figure('fine_by_type', selected_ufs, date_filters, type_values, build_fig)
+                slot.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
                 
         except Exception as e:
-            st.error(f"Erro no gráfico de tipos: {e}")
+            slot.error(f"Erro no gráfico de tipos: {e}")
 
-    def create_gravity_distribution_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_gravity_distribution_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráfico de distribuição por gravidade incluindo infrações sem avaliação."""
+        slot = st.empty()
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
-            
-            if df.empty or 'GRAVIDADE_INFRACAO' not in df.columns:
-                return
+            # GROUP BY no banco (nulos/vazios como "Sem avaliação feita"); sem suporte, usa o pandas
+            gravity_counts = self._server_aggregate('gravity', selected_ufs, date_filters)
             
-            # Prepara DataFrame tratando valores vazios/nulos como "Sem avaliação feita"
-            df_processed = df.copy()
-            df_processed['GRAVIDADE_INFRACAO'] = df_processed['GRAVIDADE_INFRACAO'].fillna('Sem avaliação feita')
-            df_processed['GRAVIDADE_INFRACAO'] = df_processed['GRAVIDADE_INFRACAO'].replace('', 'Sem avaliação feita')
+            if gravity_counts is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['gravity'])
+                
+                if len(df.index) == 0 or 'GRAVIDADE_INFRACAO' not in df.columns:
+                    return
+                
+                # Conta sobre os códigos (category) e só depois junta nulos/vazios em "Sem avaliação feita"
+                raw_counts = df['GRAVIDADE_INFRACAO'].value_counts(dropna=False)
+                raw_counts = raw_counts[raw_counts > 0]
+                labels = ['Sem avaliação feita' if pd.isna(value) or value == '' else value for value in raw_counts.index]
+                gravity_counts = raw_counts.groupby(labels, sort=False).sum().sort_values(ascending=False, kind='stable')
             
-            # Conta infrações por gravidade (dados já são únicos POR SESSÃO)
-            gravity_counts = df_processed['GRAVIDADE_INFRACAO'].value_counts()
             method_note = "infrações únicas desta sessão"
             
             if not gravity_counts.empty:
-                # Define cores específicas para as categorias
-                color_map = {
-                    'Baixa': '#28a745',          # Verde
-                    'Média': '#ffc107',          # Amarelo  
-                    'Sem avaliação feita': '#6c757d'  # Cinza
-                }
-                
-                # Cria lista de cores baseada nos dados (ordem: Baixa, Média, Sem avaliação feita)
-                gravity_order = ['Baixa', 'Média', 'Sem avaliação feita']
-                ordered_counts = []
-                ordered_names = []
-                ordered_colors = []
-                
-                for gravity in gravity_order:
-                    if gravity in gravity_counts.index:
-                        ordered_counts.append(gravity_counts[gravity])
-                        ordered_names.append(gravity)
-                        ordered_colors.append(color_map.get(gravity, '#17a2b8'))
-                
-                # Adiciona outras categorias que não estão na ordem padrão
-                for gravity, count in gravity_counts.items():
-                    if gravity not in gravity_order:
-                        ordered_counts.append(count)
-                        ordered_names.append(gravity)
-                        ordered_colors.append('#17a2b8')  # Cor padrão
-                
-                fig = px.pie(
-                    values=ordered_counts,
-                    names=ordered_names,
-                    title=f"<b>Distribuição por Gravidade da Infração ({method_note})</b>", 
-                    hole=0.4,
-                    color_discrete_sequence=ordered_colors
-                )
-                
-                # Adiciona informação sobre dados sem avaliação se existirem
-                sem_avaliacao = gravity_counts.get('Sem avaliação feita', 0)
-                if sem_avaliacao > 0:
-                    total_infracoes = gravity_counts.sum()
-                    percentual_sem_avaliacao = (sem_avaliacao / total_infracoes) * 100
+                def build_fig():
+                    # Define cores específicas para as categorias
+                    color_map = {
+                        'Baixa': '#28a745',          # Verde
+                        'Média': '#ffc107',          # Amarelo  
+                        'Sem avaliação feita': '#6c757d'  # Cinza
+                    }
                     
-                    fig.add_annotation(
-                        text=f"* {sem_avaliacao:,} infrações ({percentual_sem_avaliacao:.1f}%) sem avaliação de gravidade",
-                        xref="paper", yref="paper",
-                        x=0.5, y=-0.1, xanchor='center', yanchor='top',
-                        showarrow=False,
-                        font=dict(size=10, color="gray")
+                    # Ordem fixa (Baixa, Média, Sem avaliação feita) seguida das demais categorias
+                    gravity_order = ['Baixa', 'Média', 'Sem avaliação feita']
+                    present = [gravity for gravity in gravity_order if gravity in gravity_counts.index]
+                    extras = [gravity for gravity in gravity_counts.index if gravity not in gravity_order]
+                    ordered = gravity_counts.reindex(present + extras)  # só rótulos existentes: contagens seguem inteiras
+                    ordered_colors = [color_map.get(gravity, '#17a2b8') for gravity in ordered.index]  # Cor padrão para as demais
+                    
+                    fig = _px().pie(
+                        values=ordered.to_numpy(),
+                        names=ordered.index.tolist(),
+                        title=f"<b>Distribuição por Gravidade da Infração ({method_note})</b>", 
+                        hole=0.4,
+                        color_discrete_sequence=ordered_colors
                     )
+                    
+                    # Adiciona informação sobre dados sem avaliação se existirem
+                    sem_avaliacao = gravity_counts.get('Sem avaliação feita', 0)
+                    if sem_avaliacao > 0:
+                        total_infracoes = gravity_counts.sum()
+                        percentual_sem_avaliacao = (sem_avaliacao / total_infracoes) * 100
+                        
+                        fig.add_annotation(
+                            text=f"* {sem_avaliacao:,} infrações ({percentual_sem_avaliacao:.1f}%) sem avaliação de gravidade",
+                            xref="paper", yref="paper",
+                            x=0.5, y=-0.1, xanchor='center', yanchor='top',
+                            showarrow=False,
+                            font=dict(size=10, color="gray")
+                        )
+                    
+                    return fig
                 
-                st.plotly_chart(fig, use_container_width=True)
+                fig = self._cached_figure('gravity', selected_ufs, date_filters, gravity_counts, build_fig)
+                slot.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
                 
         except Exception as e:
-            st.error(f"Erro no gráfico de gravidade: {e}")
+            slot.error(f"Erro no gráfico de gravidade: {e}")
 
-    def create_main_offenders_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_main_offenders_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráficos dos principais infratores separados por pessoas físicas (CPF) e empresas (CNPJ) com dados únicos garantidos POR SESSÃO."""
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
+            # Classificação CPF/CNPJ e Top 10 de cada grupo no banco; sem suporte, sobre os dados carregados
+            groups = self._server_aggregate('offenders', selected_ufs, date_filters)
             
-            if df.empty:
-                return
-            
-            # Verifica se temos as colunas necessárias
-            required_cols = ['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR', 'VAL_AUTO_INFRACAO']
-            if not all(col in df.columns for col in required_cols):
-                st.warning("Colunas necessárias para análise de infratores não encontradas.")
-                return
+            if groups is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['offenders'])
+                
+                if len(df.index) == 0:
+                    return
+                
+                # Verifica se temos as colunas necessárias (uma consulta ao índice hash das colunas)
+                required_cols = ['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR', 'VAL_AUTO_INFRACAO_NUMERIC']
+                if df.columns.intersection(required_cols).size < len(required_cols):
+                    st.warning("Colunas necessárias para análise de infratores não encontradas.")
+                    return
+                
+                # Registros com nome, documento e valor válidos
+                groups = self._chart_aggregate('offenders', df)
             
-            # Remove valores inválidos
-            df_clean = df[
-                df['NOME_INFRATOR'].notna() & 
-                df['CPF_CNPJ_INFRATOR'].notna() &
-                df['VAL_AUTO_INFRACAO'].notna() &
-                (df['NOME_INFRATOR'] != '') & 
-                (df['CPF_CNPJ_INFRATOR'] != '') &
-                (df['VAL_AUTO_INFRACAO'] != '')
-            ].copy()
-            
-            if df_clean.empty:
+            if groups is None:
                 st.warning("Dados válidos não disponíveis para análise de infratores.")
                 return
             
-            # Converte valores para numérico
-            df_clean['VAL_AUTO_INFRACAO_NUMERIC'] = pd.to_numeric(
-                df_clean['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.'), 
-                errors='coerce'
-            )
-            
-            # Remove valores que não conseguiram ser convertidos
-            df_clean = df_clean[df_clean['VAL_AUTO_INFRACAO_NUMERIC'].notna()]
-            
-            if df_clean.empty:
-                st.warning("Nenhum valor de multa válido encontrado.")
-                return
-            
-            # Função para identificar CPF (formato: XXX.XXX.XXX-XX)
-            def is_cpf(cpf_cnpj):
-                if pd.isna(cpf_cnpj):
-                    return False
-                cpf_cnpj_str = str(cpf_cnpj).strip()
-                # CPF tem 14 caracteres com pontos e hífen: XXX.XXX.XXX-XX
-                if len(cpf_cnpj_str) == 14 and cpf_cnpj_str.count('.') == 2 and cpf_cnpj_str.count('-') == 1:
-                    return True
-                return False
-            
-            # Função para identificar CNPJ (formato: XX.XXX.XXX/XXXX-XX)
-            def is_cnpj(cpf_cnpj):
-                if pd.isna(cpf_cnpj):
-                    return False
-                cpf_cnpj_str = str(cpf_cnpj).strip()
-                # CNPJ tem 18 caracteres com pontos, barra e hífen: XX.XXX.XXX/XXXX-XX
-                if len(cpf_cnpj_str) == 18 and cpf_cnpj_str.count('.') == 2 and cpf_cnpj_str.count('/') == 1 and cpf_cnpj_str.count('-') == 1:
-                    return True
-                return False
-            
-            # Separa pessoas físicas (CPF) e empresas (CNPJ)
-            df_clean['is_cpf'] = df_clean['CPF_CNPJ_INFRATOR'].apply(is_cpf)
-            df_clean['is_cnpj'] = df_clean['CPF_CNPJ_INFRATOR'].apply(is_cnpj)
-            
-            df_pessoas_fisicas = df_clean[df_clean['is_cpf']]
-            df_empresas = df_clean[df_clean['is_cnpj']]
-            
             # Gráfico 1: Top 10 Pessoas Físicas (CPF) - PRIMEIRO
-            if not df_pessoas_fisicas.empty:
-                # Agrupa por NOME_INFRATOR e CPF_CNPJ_INFRATOR, soma os valores (dados já únicos POR SESSÃO)
-                pf_grouped = df_pessoas_fisicas.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().reset_index()
-                pf_grouped = pf_grouped.nlargest(10, 'VAL_AUTO_INFRACAO_NUMERIC')
-                
-                if not pf_grouped.empty:
+            pf_grouped = groups["pessoas_fisicas"]
+            if not pf_grouped.empty:
+                def build_fig():
                     # Cria rótulo combinado (nome + CPF mascarado)
-                    pf_grouped['label'] = pf_grouped.apply(
-                        lambda x: f"{x['NOME_INFRATOR'][:40]}{'...' if len(x['NOME_INFRATOR']) > 40 else ''}\n(CPF: {x['CPF_CNPJ_INFRATOR'][:3]}.***.***-{x['CPF_CNPJ_INFRATOR'][-2:]})", 
-                        axis=1
+                    names = pf_grouped['NOME_INFRATOR'].astype(str)
+                    cpfs = pf_grouped['CPF_CNPJ_INFRATOR'].astype(str)
+                    pf_grouped['label'] = (
+                        names.str.slice(0, 40) + np.where(names.str.len() > 40, '...', '') +
+                        '\n(CPF: ' + cpfs.str.slice(0, 3) + '.***.***-' + cpfs.str.slice(-2) + ')'
                     )
                     
-                    fig_pf = px.bar(
+                    fig_pf = _px().bar(
                         pf_grouped.sort_values('VAL_AUTO_INFRACAO_NUMERIC'), 
                         y='label', 
                         x='VAL_AUTO_INFRACAO_NUMERIC', 
@@ -577,13 +1484,14 @@ class DataVisualization:
                         textposition='outside'
                     )
                     
-                    st.plotly_chart(fig_pf, use_container_width=True)
-                    
-                    # Mostra estatísticas
-                    total_pf = pf_grouped['VAL_AUTO_INFRACAO_NUMERIC'].sum()
-                    st.caption(f"💰 Total: R$ {total_pf:,.2f} | 👥 {len(pf_grouped)} pessoas físicas (dados únicos desta sessão)")
-                else:
-                    st.info("Nenhuma pessoa física encontrada nos dados filtrados.")
+                    return fig_pf
+                
+                fig_pf = self._cached_figure('offenders_pf', selected_ufs, date_filters, pf_grouped, build_fig)
+                st.plotly_chart(fig_pf, use_container_width=True, config=PLOTLY_CONFIG)
+                
+                # Mostra estatísticas
+                total_pf = pf_grouped['VAL_AUTO_INFRACAO_NUMERIC'].sum()
+                st.caption(f"💰 Total: R$ {total_pf:,.2f} | 👥 {len(pf_grouped)} pessoas físicas (dados únicos desta sessão)")
             else:
                 st.info("Nenhuma pessoa física encontrada nos dados filtrados.")
             
@@ -591,19 +1499,17 @@ class DataVisualization:
             st.divider()
             
             # Gráfico 2: Top 10 Empresas (CNPJ) - SEGUNDO (abaixo)
-            if not df_empresas.empty:
-                # Agrupa por NOME_INFRATOR e CPF_CNPJ_INFRATOR, soma os valores (dados já únicos POR SESSÃO)
-                empresa_grouped = df_empresas.groupby(['NOME_INFRATOR', 'CPF_CNPJ_INFRATOR'])['VAL_AUTO_INFRACAO_NUMERIC'].sum().reset_index()
-                empresa_grouped = empresa_grouped.nlargest(10, 'VAL_AUTO_INFRACAO_NUMERIC')
-                
-                if not empresa_grouped.empty:
+            empresa_grouped = groups["empresas"]
+            if not empresa_grouped.empty:
+                def build_fig():
                     # Cria rótulo combinado (nome + CNPJ COMPLETO)
-                    empresa_grouped['label'] = empresa_grouped.apply(
-                        lambda x: f"{x['NOME_INFRATOR'][:40]}{'...' if len(x['NOME_INFRATOR']) > 40 else ''}\n(CNPJ: {x['CPF_CNPJ_INFRATOR']})", 
-                        axis=1
+                    names = empresa_grouped['NOME_INFRATOR'].astype(str)
+                    empresa_grouped['label'] = (
+                        names.str.slice(0, 40) + np.where(names.str.len() > 40, '...', '') +
+                        '\n(CNPJ: ' + empresa_grouped['CPF_CNPJ_INFRATOR'].astype(str) + ')'
                     )
                     
-                    fig_empresa = px.bar(
+                    fig_empresa = _px().bar(
                         empresa_grouped.sort_values('VAL_AUTO_INFRACAO_NUMERIC'), 
                         y='label', 
                         x='VAL_AUTO_INFRACAO_NUMERIC', 
@@ -627,198 +1533,130 @@ class DataVisualization:
                         textposition='outside'
                     )
                     
-                    st.plotly_chart(fig_empresa, use_container_width=True)
-                    
-                    # Mostra estatísticas
-                    total_empresa = empresa_grouped['VAL_AUTO_INFRACAO_NUMERIC'].sum()
-                    st.caption(f"💰 Total: R$ {total_empresa:,.2f} | 🏢 {len(empresa_grouped)} empresas (dados únicos desta sessão)")
-                else:
-                    st.info("Nenhuma empresa encontrada nos dados filtrados.")
+                    return fig_empresa
+                
+                fig_empresa = self._cached_figure('offenders_empresas', selected_ufs, date_filters, empresa_grouped, build_fig)
+                st.plotly_chart(fig_empresa, use_container_width=True, config=PLOTLY_CONFIG)
+                
+                # Mostra estatísticas
+                total_empresa = empresa_grouped['VAL_AUTO_INFRACAO_NUMERIC'].sum()
+                st.caption(f"💰 Total: R$ {total_empresa:,.2f} | 🏢 {len(empresa_grouped)} empresas (dados únicos desta sessão)")
             else:
                 st.info("Nenhuma empresa encontrada nos dados filtrados.")
             
             # Estatísticas gerais no final
-            total_identificados = len(df_pessoas_fisicas) + len(df_empresas)
-            total_nao_identificados = len(df_clean) - total_identificados
+            n_pf, n_empresas = groups["total_pf"], groups["total_empresas"]
+            total_nao_identificados = groups["total_validos"] - n_pf - n_empresas
             
             if total_nao_identificados > 0:
-                st.info(f"📊 **Resumo Geral:** {len(df_pessoas_fisicas)} pessoas físicas, {len(df_empresas)} empresas, {total_nao_identificados} registros com formato de CPF/CNPJ não identificado (todos dados únicos desta sessão)")
+                st.info(f"📊 **Resumo Geral:** {n_pf} pessoas físicas, {n_empresas} empresas, {total_nao_identificados} registros com formato de CPF/CNPJ não identificado (todos dados únicos desta sessão)")
             else:
-                st.info(f"📊 **Resumo Geral:** {len(df_pessoas_fisicas)} pessoas físicas, {len(df_empresas)} empresas identificadas (todos dados únicos desta sessão)")
+                st.info(f"📊 **Resumo Geral:** {n_pf} pessoas físicas, {n_empresas} empresas identificadas (todos dados únicos desta sessão)")
                 
         except Exception as e:
             st.error(f"Erro no gráfico de infratores: {e}")
 
-    def create_infraction_map_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_infraction_map_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria mapa de calor das infrações com dados únicos garantidos POR SESSÃO."""
         st.subheader("Mapa de Calor de Infrações")
+        slot = st.empty()
         
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
+            if df is None:
+                df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['map'], CHART_REQUIRED['map'])
             
-            if df.empty:
-                st.warning("Nenhum dado encontrado.")
+            if len(df.index) == 0:
+                slot.warning("Nenhum dado encontrado.")
                 return
             
             # Filtra dados com coordenadas
-            required_cols = ['NUM_LATITUDE_AUTO', 'NUM_LONGITUDE_AUTO']
-            if not all(col in df.columns for col in required_cols):
-                st.warning("Dados de geolocalização não disponíveis.")
+            required_cols = CHART_REQUIRED['map']
+            if df.columns.intersection(required_cols).size < len(required_cols):
+                slot.warning("Dados de geolocalização não disponíveis.")
                 return
             
             with st.spinner("Carregando dados do mapa..."):
-                # Remove valores vazios e converte coordenadas
-                df_map = df[
-                    df['NUM_LATITUDE_AUTO'].notna() & 
-                    df['NUM_LONGITUDE_AUTO'].notna() &
-                    (df['NUM_LATITUDE_AUTO'] != '') &
-                    (df['NUM_LONGITUDE_AUTO'] != '')
-                ].copy()
-                
-                if df_map.empty:
-                    st.warning("Nenhuma coordenada válida encontrada.")
-                    return
-                
-                # Limita para performance (dados já são únicos POR SESSÃO)
-                if len(df_map) > 5000:
-                    df_map = df_map.sample(n=5000, random_state=42)  # random_state para reprodutibilidade
-                
-                # Converte coordenadas
-                df_map['lat'] = pd.to_numeric(df_map['NUM_LATITUDE_AUTO'].astype(str).str.replace(',', '.'), errors='coerce')
-                df_map['lon'] = pd.to_numeric(df_map['NUM_LONGITUDE_AUTO'].astype(str).str.replace(',', '.'), errors='coerce')
+                # Todos os pontos agregados em células da grade (O(N), sem amostragem)
+                df_map, n_points = self._chart_aggregate('map', df)
                 
-                # Remove coordenadas inválidas
-                df_map = df_map.dropna(subset=['lat', 'lon'])
+                if n_points == 0:
+                    slot.warning("Nenhuma coordenada válida encontrada.")
+                    return
                 
                 if not df_map.empty:
-                    st.map(df_map[['lat', 'lon']], zoom=3)
-                    st.caption(f"📍 Exibindo {len(df_map):,} pontos de {len(df):,} infrações únicas desta sessão | {date_filters['description']}")
+                    map_html = _build_map_html(tuple(sorted(selected_ufs or ())), _date_filters_key(date_filters), _data_key(df_map), df_map)
+                    with slot.container():
+                        components.html(map_html, height=500)
+                        st.caption(f"📍 Exibindo {n_points:,} pontos ({len(df_map):,} células) de {len(df):,} infrações únicas desta sessão | {date_filters['description']}")
                 else:
-                    st.warning("Nenhuma coordenada válida após conversão.")
+                    slot.warning("Nenhuma coordenada válida após conversão.")
                     
         except Exception as e:
-            st.error(f"Erro no mapa: {e}")
+            slot.error(f"Erro no mapa: {e}")
 
-    def create_infraction_status_chart_advanced(self, selected_ufs: list, date_filters: dict):
+    def create_infraction_status_chart_advanced(self, selected_ufs: list, date_filters: dict, df: pd.DataFrame = None):
         """Cria gráfico do status das infrações com dados únicos garantidos POR SESSÃO."""
+        slot = st.empty()
         try:
-            df = self._get_filtered_data_advanced(selected_ufs, date_filters)
-            
-            if df.empty or 'DES_STATUS_FORMULARIO' not in df.columns:
-                return
+            # GROUP BY no banco; sem suporte, conta sobre os dados carregados
+            status_counts = self._server_aggregate('status', selected_ufs, date_filters)
             
-            # Remove valores vazios
-            df_clean = df[df['DES_STATUS_FORMULARIO'].notna() & (df['DES_STATUS_FORMULARIO'] != '')]
-            
-            if df_clean.empty:
-                return
-            
-            # Conta infrações por status (dados já são únicos POR SESSÃO)
-            status_counts = df_clean['DES_STATUS_FORMULARIO'].value_counts().head(10)
+            if status_counts is None:
+                if df is None:
+                    df = self._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['status'], CHART_REQUIRED['status'])
+                
+                if len(df.index) == 0 or 'DES_STATUS_FORMULARIO' not in df.columns:
+                    return
+                
+                # Conta infrações por status (dados já são únicos POR SESSÃO)
+                status_counts = self._chart_aggregate('status', df)
             method_note = "infrações únicas desta sessão"
             
             if not status_counts.empty:
-                chart_df = pd.DataFrame({
-                    'DES_STATUS_FORMULARIO': status_counts.index,
-                    'total': status_counts.values
-                })
-                
-                chart_df['DES_STATUS_FORMULARIO'] = chart_df['DES_STATUS_FORMULARIO'].str.title()
-                
-                fig = px.bar(
-                    chart_df.sort_values('total'), 
-                    y='DES_STATUS_FORMULARIO', 
-                    x='total', 
-                    orientation='h',
-                    title=f"<b>Estágio Atual das Infrações (Top 10 - {method_note})</b>", 
-                    text='total'
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                def build_fig():
+                    # O Top 10 já vem em ordem decrescente: basta invertê-lo (ascendente para as barras
+                    # horizontais), sem nova ordenação, e passar arrays numpy direto ao go.Bar
+                    ordered_counts = status_counts.iloc[::-1]
+                    labels = ordered_counts.index.astype(str).to_numpy()  # categorias já em title case desde a carga
+                    totals = ordered_counts.to_numpy()
+                    
+                    fig = go.Figure(go.Bar(y=labels, x=totals, text=totals, orientation='h'))
+                    fig.update_layout(
+                        title=f"<b>Estágio Atual das Infrações (Top 10 - {method_note})</b>",
+                        xaxis_title='total',
+                        yaxis_title='DES_STATUS_FORMULARIO',
+                        uirevision='status_chart'  # preserva o estado do layout entre reruns
+                    )
+                    
+                    return fig
+                
+                fig = self._cached_figure('status', selected_ufs, date_filters, status_counts, build_fig)
+                slot.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
                 
         except Exception as e:
-            st.error(f"Erro no gráfico de status: {e}")
+            slot.error(f"Erro no gráfico de status: {e}")
 
     # ======================== MÉTODOS LEGACY (para compatibilidade) ========================
 
-    def create_overview_metrics(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_overview_metrics_advanced(selected_ufs, date_filters)
-
-    def create_infraction_map(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_infraction_map_advanced(selected_ufs, date_filters)
-
-    def create_municipality_hotspots_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_municipality_hotspots_chart_advanced(selected_ufs, date_filters)
-
-    def create_fine_value_by_type_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_fine_value_by_type_chart_advanced(selected_ufs, date_filters)
-
-    def create_gravity_distribution_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters e inclui infrações sem avaliação."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_gravity_distribution_chart_advanced(selected_ufs, date_filters)
-
-    def create_state_distribution_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_state_distribution_chart_advanced(selected_ufs, date_filters)
-
-    def create_infraction_status_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_infraction_status_chart_advanced(selected_ufs, date_filters)
-
-    def create_main_offenders_chart(self, selected_ufs: list, year_range: tuple):
-        """Método legacy - converte year_range para date_filters."""
-        date_filters = {
-            "mode": "simple",
-            "years": list(range(year_range[0], year_range[1] + 1)),
-            "year_range": year_range,
-            "description": f"{year_range[0]}-{year_range[1]}"
-        }
-        return self.create_main_offenders_chart_advanced(selected_ufs, date_filters)
+    def __getattr__(self, name: str):
+        """
+        Métodos legacy create_<gráfico>(selected_ufs, year_range): só chamados quando o atributo
+        não existe; convertem year_range para date_filters e delegam a create_<gráfico>_advanced.
+        """
+        target = None
+        if name.startswith('create_') and not name.endswith('_advanced'):
+            target = getattr(type(self), f"{name}_advanced", None)
+        if target is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        
+        target = target.__get__(self)
+
+        def legacy(selected_ufs: list, year_range: tuple):
+            return target(selected_ufs, _year_range_filters(tuple(year_range)))
+        
+        legacy.__name__ = name
+        legacy.__doc__ = f"Método legacy - converte year_range para date_filters e chama {name}_advanced."
+        return legacy
 
     def force_refresh(self):
         """Força atualização dos dados limpando cache da sessão."""
@@ -838,28 +1676,16 @@ class DataVisualization:
                     "description": "Todos os dados desta sessão"
                 }
             
-            # Obtém dados DESTA SESSÃO
-            df = self._get_filtered_data_advanced(selected_ufs or [], date_filters)
-            
-            if df.empty:
-                return {"error": "Nenhum dado disponível nesta sessão"}
-            
-            # Análise de qualidade DESTA SESSÃO
-            quality_info = {
-                "total_records": len(df),
-                "has_num_auto_infracao": 'NUM_AUTO_INFRACAO' in df.columns,
-                "unique_infractions": df['NUM_AUTO_INFRACAO'].nunique() if 'NUM_AUTO_INFRACAO' in df.columns else 0,
-                "null_num_auto": df['NUM_AUTO_INFRACAO'].isna().sum() if 'NUM_AUTO_INFRACAO' in df.columns else 0,
-                "columns_count": len(df.columns),
-                "memory_usage_mb": df.memory_usage(deep=True).sum() / 1024 / 1024,
-                "date_range": {
-                    "min": df['DAT_HORA_AUTO_INFRACAO'].min() if 'DAT_HORA_AUTO_INFRACAO' in df.columns else None,
-                    "max": df['DAT_HORA_AUTO_INFRACAO'].max() if 'DAT_HORA_AUTO_INFRACAO' in df.columns else None
-                },
-                "states_count": df['UF'].nunique() if 'UF' in df.columns else 0,
-                "municipalities_count": df['MUNICIPIO'].nunique() if 'MUNICIPIO' in df.columns else 0,
-                "session_isolated": True  # Marca que os dados são isolados por sessão
-            }
+            # Análise de qualidade DESTA SESSÃO (cacheada por filtros)
+            quality_info = dict(_compute_data_quality_info(
+                self,
+                tuple(selected_ufs or []),
+                _date_filters_key(date_filters),
+                date_filters
+            ))
+            
+            if "error" in quality_info:
+                return quality_info
             
             # Verifica consistência DESTA SESSÃO
             if quality_info["has_num_auto_infracao"]:
@@ -874,10 +1700,28 @@ class DataVisualization:
         except Exception as e:
             return {"error": f"Erro na análise de qualidade desta sessão: {str(e)}"}
 
+    @st.fragment
     def display_data_quality_info(self, selected_ufs: list = None, date_filters: dict = None):
-        """Exibe informações sobre a qualidade dos dados DESTA SESSÃO."""
+        """
+        Exibe informações sobre a qualidade dos dados DESTA SESSÃO (calculadas sob demanda).
+        Roda como fragmento: o botão do diagnóstico reexecuta só este bloco, não o dashboard.
+        """
         with st.expander("🔍 Informações de Qualidade dos Dados (Esta Sessão)"):
-            quality_info = self.get_data_quality_info(selected_ufs, date_filters)
+            # O conteúdo do expander roda mesmo fechado: só calcula quando o usuário pede
+            filters_key = (tuple(selected_ufs or []), _date_filters_key(date_filters) if date_filters else None)
+            
+            if st.button("Carregar diagnóstico", key="qual_btn"):
+                st.session_state['data_quality_info'] = {
+                    "filters_key": filters_key,
+                    "info": self.get_data_quality_info(selected_ufs, date_filters)
+                }
+            
+            cached = st.session_state.get('data_quality_info')
+            if not cached or cached["filters_key"] != filters_key:
+                st.caption("Clique em \"Carregar diagnóstico\" para analisar os dados filtrados.")
+                return
+            
+            quality_info = cached["info"]
             
             if "error" in quality_info:
                 st.error(quality_info["error"])
@@ -907,10 +1751,6 @@ class DataVisualization:
                 else:
                     st.warning(f"⚠️ {quality_info['duplicate_records']} registros duplicados removidos nesta sessão")
             
-            # Isolamento de sessão
-            if quality_info.get('session_isolated'):
-                st.info("🔒 **Dados isolados por sessão** - cada usuário vê seus próprios dados únicos")
-            
             # Range de datas
             if quality_info['date_range']['min'] and quality_info['date_range']['max']:
                 st.info(f"📅 Período: {quality_info['date_range']['min']} a {quality_info['date_range']['max']}")
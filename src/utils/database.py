@@ -3,7 +3,91 @@ import duckdb
 import streamlit as st
 from supabase import create_client, Client
 import os
+import re
+import shutil
+import threading
+import uuid
 import config
+from src.utils.supabase_utils import iter_record_pages, records_pages_to_dataframe, records_to_dataframe, parse_decimal_values
+
+# Agregado por UF/mês/município/gravidade/tipo/status: os gráficos somam poucas centenas de linhas
+# em vez de varrer a tabela. No Postgres (Supabase) é uma materialized view criada uma vez,
+# junto com a função que a atualiza (chamada após cada carga diária e pelo botão "Limpar Cache"):
+#   CREATE MATERIALIZED VIEW ibama_agg AS <AGGREGATE_SELECT>;
+#   CREATE FUNCTION refresh_ibama_agg() RETURNS void LANGUAGE sql SECURITY DEFINER
+#       AS 'REFRESH MATERIALIZED VIEW ibama_agg';
+# Sem a view, Database.get_aggregate_source() devolve None e os gráficos consultam a tabela completa.
+# No DuckDB local é uma tabela temporária (em memória, por conexão) criada por Database.get_aggregate_source():
+# não grava no arquivo do banco, cujo mtime decide quando reexportar o Parquet.
+AGGREGATE_TABLE = "ibama_agg"
+AGGREGATE_REFRESH_RPC = "refresh_ibama_agg"
+
+# VAL_AUTO_INFRACAO (texto com vírgula decimal) como número, em SQL portátil (DuckDB e Postgres)
+FINE_VALUE_SQL = 'CAST(NULLIF(REPLACE(CAST("VAL_AUTO_INFRACAO" AS VARCHAR), \',\', \'.\'), \'\') AS DOUBLE PRECISION)'
+
+# Linha mantida de um NUM_AUTO_INFRACAO repetido: a primeira por data/hora e UF (texto em ordem binária,
+# nulos por último), a mesma ordem de supabase_utils.first_infraction_mask no pandas
+DEDUP_ORDER_SQL = (
+    'CAST("DAT_HORA_AUTO_INFRACAO" AS VARCHAR) COLLATE "C" NULLS LAST, CAST("UF" AS VARCHAR) COLLATE "C" NULLS LAST'
+)
+
+# A deduplicação vem depois dos filtros de UF e período (como no pandas), então não pode ser feita
+# de uma vez na tabela toda. Autos cujas linhas caem todas numa única célula UF/mês entram ou saem
+# inteiros de qualquer filtro: já saem deduplicados e somados (num nulo). Os demais guardam uma linha
+# por célula (num preenchido), e a escolha entre elas é feita na consulta, depois do filtro.
+AGGREGATE_SELECT = f"""
+    WITH linhas AS (
+        SELECT "NUM_AUTO_INFRACAO" AS num_auto, CAST("DAT_HORA_AUTO_INFRACAO" AS VARCHAR) AS data_hora,
+            SUBSTR(CAST("DAT_HORA_AUTO_INFRACAO" AS VARCHAR), 1, 7) AS celula_mes,
+            "UF", "COD_MUNICIPIO", "MUNICIPIO", "GRAVIDADE_INFRACAO", "TIPO_INFRACAO", "DES_STATUS_FORMULARIO",
+            {FINE_VALUE_SQL} AS valor,
+            ROW_NUMBER() OVER (
+                PARTITION BY "NUM_AUTO_INFRACAO", "UF", SUBSTR(CAST("DAT_HORA_AUTO_INFRACAO" AS VARCHAR), 1, 7)
+                ORDER BY {DEDUP_ORDER_SQL}
+            ) AS ocorrencia
+        FROM ibama_infracao
+        WHERE "NUM_AUTO_INFRACAO" IS NOT NULL AND CAST("NUM_AUTO_INFRACAO" AS VARCHAR) <> ''
+            AND "DAT_HORA_AUTO_INFRACAO" IS NOT NULL  -- sem data a linha não passa em nenhum filtro de período
+    ), celulas AS (
+        -- Primeira linha de cada auto em cada célula UF/mês
+        SELECT *, COUNT(*) OVER (PARTITION BY num_auto) > 1 AS varias_celulas
+        FROM linhas WHERE ocorrencia = 1
+    )
+    SELECT "UF", SUBSTR(data_hora, 1, 4) AS ano, celula_mes AS ano_mes,
+        "COD_MUNICIPIO", "MUNICIPIO", "GRAVIDADE_INFRACAO", "TIPO_INFRACAO", "DES_STATUS_FORMULARIO",
+        COUNT(*) AS total, SUM(valor) AS valor, CAST(NULL AS VARCHAR) AS num, CAST(NULL AS VARCHAR) AS data_hora
+    FROM celulas WHERE NOT varias_celulas
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+    UNION ALL
+    SELECT "UF", SUBSTR(data_hora, 1, 4), celula_mes,
+        "COD_MUNICIPIO", "MUNICIPIO", "GRAVIDADE_INFRACAO", "TIPO_INFRACAO", "DES_STATUS_FORMULARIO",
+        1, valor, CAST(num_auto AS VARCHAR), data_hora
+    FROM celulas WHERE varias_celulas
+"""
+
+# Limites das simulações de consulta quando a RPC execute_raw_sql não existe (linhas lidas em páginas de 1000)
+METRIC_FALLBACK_MAX_ROWS = 100000
+GENERAL_FALLBACK_MAX_ROWS = 50000
+FALLBACK_PAGE_SIZE = 1000
+
+# Coluna lida quando a consulta não cita nenhuma coluna da tabela (ex.: COUNT(*)): evita baixar todas
+FALLBACK_DEFAULT_COLUMN = 'NUM_AUTO_INFRACAO'
+
+def is_sql_error(error) -> bool:
+    """
+    Erro da própria consulta SQL (a RPC execute_raw_sql existe e rodou): o PostgREST repassa o SQLSTATE
+    do Postgres (5 caracteres) como código. Função ausente (PGRST202), permissão ou rede não são.
+    """
+    code = getattr(error, 'code', None)
+    return isinstance(code, str) and len(code) == 5 and not code.startswith('PGRST')
+
+# Sessões do Streamlit são threads do mesmo processo: uma exportação Parquet por vez
+_PARQUET_EXPORT_LOCK = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _get_supabase_client(url: str, key: str) -> Client:
+    """Cliente Supabase único para todas as sessões: reruns e novas sessões reaproveitam as conexões HTTP/TLS."""
+    return create_client(url, key)
 
 class Database:
     def __init__(self):
@@ -11,6 +95,10 @@ class Database:
         self.is_cloud = config.IS_RUNNING_ON_STREAMLIT_CLOUD
         self.connection = None
         self.supabase = None
+        self._aggregate_ready = None  # None: ainda não verificado
+        # False depois que a RPC execute_raw_sql falha por não existir ou estar inacessível:
+        # as consultas seguintes desta sessão não a tentam de novo
+        self.sql_rpc_available = True
         
         try:
             if self.is_cloud:
@@ -30,7 +118,7 @@ class Database:
         if not url or not key:
             raise ValueError("Credenciais do Supabase não configuradas")
         
-        self.supabase = create_client(url, key)
+        self.supabase = _get_supabase_client(url, key)
         
         # Teste de conectividade
         try:
@@ -57,6 +145,102 @@ class Database:
         db_path = config.DB_PATH
         self.connection = duckdb.connect(db_path)
 
+    def get_parquet_source(self) -> str:
+        """
+        Retorna a fonte SQL para leituras filtradas no DuckDB local.
+        Exporta a tabela para Parquet particionado por UF (uma vez, ou quando o banco
+        for mais novo que a exportação) e devolve um read_parquet com hive_partitioning,
+        que permite ao DuckDB podar partições por UF e row groups por data.
+        Em caso de falha, devolve a própria tabela.
+        """
+        if self.is_cloud or not self.connection:
+            return "ibama_infracao"
+        
+        parquet_dir = os.path.normpath(config.PARQUET_DIR)
+        pattern = os.path.join(parquet_dir, "**", "*.parquet")
+        
+        try:
+            with _PARQUET_EXPORT_LOCK:
+                db_mtime = os.path.getmtime(config.DB_PATH) if os.path.exists(config.DB_PATH) else 0
+                marker = os.path.join(parquet_dir, ".exported")
+                
+                if not os.path.exists(marker) or os.path.getmtime(marker) < db_mtime:
+                    self._export_parquet(parquet_dir)
+            
+            return f"read_parquet('{pattern}', hive_partitioning = 1)"
+        except Exception as e:
+            print(f"⚠️ Parquet indisponível, usando a tabela: {e}")
+            return "ibama_infracao"
+
+    def _export_parquet(self, parquet_dir: str):
+        """
+        Exporta a tabela para um diretório irmão temporário e só então o coloca no lugar de parquet_dir
+        (renames no mesmo sistema de arquivos): leitores nunca veem uma exportação pela metade.
+        """
+        print(f"📦 Exportando ibama_infracao para Parquet em {parquet_dir}...")
+        suffix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        staging = f"{parquet_dir}.tmp-{suffix}"
+        os.makedirs(os.path.dirname(parquet_dir) or ".", exist_ok=True)
+        try:
+            self.connection.execute(f"COPY ibama_infracao TO '{staging}' (FORMAT PARQUET, PARTITION_BY (UF))")
+            with open(os.path.join(staging, ".exported"), "w") as f:
+                f.write("ok")
+            
+            # A exportação anterior sai do caminho e é apagada depois da troca
+            retired = None
+            if os.path.exists(parquet_dir):
+                retired = f"{parquet_dir}.old-{suffix}"
+                os.replace(parquet_dir, retired)
+            os.replace(staging, parquet_dir)
+            if retired:
+                shutil.rmtree(retired, ignore_errors=True)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def get_aggregate_source(self):
+        """
+        Retorna o nome da tabela pré-agregada (AGGREGATE_TABLE) ou None se indisponível.
+        No Supabase verifica uma vez se a materialized view existe; no DuckDB cria uma vez
+        por conexão uma tabela temporária, que não altera o arquivo do banco.
+        """
+        if self._aggregate_ready is None:
+            self._aggregate_ready = self._prepare_aggregate_source()
+        return AGGREGATE_TABLE if self._aggregate_ready else None
+
+    def _prepare_aggregate_source(self) -> bool:
+        """Verifica (Supabase) ou cria (DuckDB) a tabela pré-agregada; False se indisponível."""
+        try:
+            if self.is_cloud:
+                if not self.supabase:
+                    return False
+                # Uma linha basta: a consulta falha quando a view não foi criada (ou é de uma versão sem num)
+                self.supabase.table(AGGREGATE_TABLE).select('total,num').limit(1).execute()
+                print(f"✅ View agregada {AGGREGATE_TABLE} disponível")
+                return True
+            
+            if not self.connection:
+                return False
+            # TEMP: fica na memória desta conexão, sem mexer no mtime do arquivo (ver get_parquet_source)
+            self.connection.execute(f"CREATE OR REPLACE TEMP TABLE {AGGREGATE_TABLE} AS {AGGREGATE_SELECT}")
+            print(f"✅ Tabela agregada {AGGREGATE_TABLE} criada")
+            return True
+        except Exception as e:
+            print(f"⚠️ Tabela agregada indisponível, usando a tabela completa: {e}")
+            return False
+
+    def refresh_aggregate_source(self):
+        """
+        Descarta a tabela pré-agregada atual ("Limpar Cache"): no Supabase pede a atualização da view
+        (AGGREGATE_REFRESH_RPC); no DuckDB a tabela temporária é recriada na próxima consulta.
+        """
+        if self.is_cloud and self.supabase and self._aggregate_ready:
+            try:
+                self.supabase.rpc(AGGREGATE_REFRESH_RPC, {}).execute()
+                print(f"✅ View agregada {AGGREGATE_TABLE} atualizada")
+            except Exception as e:
+                print(f"⚠️ Não foi possível atualizar a view {AGGREGATE_TABLE}: {e}")
+        self._aggregate_ready = None
+
     def get_unique_values(self, column: str, limit: int = 50000) -> list:
         """Obtém valores únicos de uma coluna específica."""
         try:
@@ -121,12 +305,15 @@ class Database:
         try:
             # Método melhorado: usar a função RPC personalizada se disponível
             # Primeiro, tenta usar RPC se a função estiver disponível
-            try:
-                result = self.supabase.rpc('execute_raw_sql', {'sql_query': query}).execute()
-                if result.data:
-                    return pd.DataFrame(result.data)
-            except:
-                pass  # Se RPC não funcionar, usa método alternativo
+            if self.sql_rpc_available:
+                try:
+                    result = self.supabase.rpc('execute_raw_sql', {'sql_query': query}).execute()
+                    if result.data:
+                        return pd.DataFrame(result.data)
+                except Exception as e:
+                    # Se RPC não funcionar, usa método alternativo (e não a tenta mais, se ela não existe)
+                    if not is_sql_error(e):
+                        self.sql_rpc_available = False
             
             # Método alternativo: tentar simular a consulta
             # Para consultas de agregação simples
@@ -134,17 +321,15 @@ class Database:
                 # Busca TODOS os dados para fazer agregação correta
                 print("Executando consulta de agregação - buscando todos os dados...")
                 
-                # Tenta buscar todos os dados primeiro
-                try:
-                    result = self.supabase.table('ibama_infracao').select('*').execute()
-                    df_full = pd.DataFrame(result.data)
-                    print(f"Total de registros carregados para agregação: {len(df_full)}")
-                except Exception as e:
-                    print(f"Erro ao buscar todos os dados: {e}")
-                    # Fallback com limite alto
-                    result = self.supabase.table('ibama_infracao').select('*').limit(100000).execute()
-                    df_full = pd.DataFrame(result.data)
-                    print(f"Registros carregados com limite: {len(df_full)}")
+                # Só as colunas usadas nas métricas abaixo (a contagem é o nº de linhas)
+                metric_columns = 'VAL_AUTO_INFRACAO,MUNICIPIO'
+                
+                # Busca em páginas (sem truncar no max-rows do servidor), até METRIC_FALLBACK_MAX_ROWS linhas
+                df_full = records_pages_to_dataframe(iter_record_pages(
+                    lambda: self.supabase.table('ibama_infracao').select(metric_columns),
+                    FALLBACK_PAGE_SIZE, -(-METRIC_FALLBACK_MAX_ROWS // FALLBACK_PAGE_SIZE)
+                ), records_to_dataframe)
+                print(f"Total de registros carregados para agregação: {len(df_full)}")
                 
                 if df_full.empty:
                     return pd.DataFrame()
@@ -154,10 +339,8 @@ class Database:
                 
                 # Calcula valor total das multas
                 try:
-                    df_full['VAL_AUTO_INFRACAO_NUMERIC'] = pd.to_numeric(
-                        df_full['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.'), 
-                        errors='coerce'
-                    )
+                    # Mesmo conversor da carga do dashboard (kernel Arrow quando disponível)
+                    df_full['VAL_AUTO_INFRACAO_NUMERIC'] = parse_decimal_values(df_full['VAL_AUTO_INFRACAO'])
                     valor_total_multas = df_full['VAL_AUTO_INFRACAO_NUMERIC'].sum()
                 except:
                     valor_total_multas = 0
@@ -173,18 +356,20 @@ class Database:
                     'total_municipios': [total_municipios]
                 })
             
-            # Para outras consultas, busca todos os dados também
-            print("Executando consulta geral - buscando todos os dados...")
-            try:
-                result = self.supabase.table('ibama_infracao').select('*').execute()
-                df = pd.DataFrame(result.data)
-                print(f"Consulta geral retornou: {len(df)} registros")
-                return df
-            except Exception as e:
-                print(f"Erro na consulta geral: {e}")
-                # Fallback com limite
-                result = self.supabase.table('ibama_infracao').select('*').limit(50000).execute()
-                return pd.DataFrame(result.data)
+            # Para outras consultas, busca as linhas brutas (só as colunas citadas na consulta),
+            # limitadas como antes: GENERAL_FALLBACK_MAX_ROWS ou o LIMIT da própria consulta, se menor
+            max_rows = GENERAL_FALLBACK_MAX_ROWS
+            limit_match = re.search(r'\bLIMIT\s+(\d+)\s*;?\s*$', query, re.IGNORECASE)
+            if limit_match:
+                max_rows = min(max_rows, int(limit_match.group(1)))
+            print(f"Executando consulta geral - buscando até {max_rows:,} registros...")
+            select_columns = self._referenced_columns(query)
+            df = records_pages_to_dataframe(iter_record_pages(
+                lambda: self.supabase.table('ibama_infracao').select(select_columns),
+                FALLBACK_PAGE_SIZE, -(-max_rows // FALLBACK_PAGE_SIZE)
+            )).head(max_rows)
+            print(f"Consulta geral retornou: {len(df)} registros")
+            return df
                 
         except Exception as e:
             print(f"Erro na consulta Supabase: {e}")
@@ -195,6 +380,26 @@ class Database:
                 'total_municipios': [0]
             })
 
+    def _referenced_columns(self, query: str) -> str:
+        """
+        Colunas da tabela citadas na consulta, no formato do select do PostgREST.
+        Retorna '*' só quando a própria consulta usa SELECT *; sem colunas identificáveis
+        (ex.: COUNT(*)) ou sem acesso às colunas da tabela, lê apenas FALLBACK_DEFAULT_COLUMN.
+        """
+        if re.search(r'SELECT\s+(DISTINCT\s+)?\*', query, re.IGNORECASE):
+            return '*'
+        
+        try:
+            # Uma linha basta para conhecer as colunas da tabela
+            sample = self.supabase.table('ibama_infracao').select('*').limit(1).execute()
+            table_columns = list(sample.data[0].keys()) if sample.data else []
+        except Exception:
+            return FALLBACK_DEFAULT_COLUMN
+        
+        identifiers = {token.upper() for token in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', query)}
+        columns = [col for col in table_columns if col.upper() in identifiers]
+        return ','.join(columns) if columns else FALLBACK_DEFAULT_COLUMN
+
     def _execute_duckdb_query(self, query: str) -> pd.DataFrame:
         """Executa consulta no DuckDB."""
         if not self.connection:
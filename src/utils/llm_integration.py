@@ -392,12 +392,11 @@ class LLMIntegration:
             # Limita número de linhas para exibição
             display_results = results.head(50) if len(results) > 50 else results
             
-            # Formata nomes das colunas
-            display_results = display_results.copy()
-            display_results.columns = [
+            # Formata nomes das colunas (set_axis devolve novo objeto sem copiar os dados)
+            display_results = display_results.set_axis([
                 col.replace('_', ' ').title() 
                 for col in display_results.columns
-            ]
+            ], axis=1)
             
             # Converte para markdown
             markdown_table = display_results.to_markdown(index=False)
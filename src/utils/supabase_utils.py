@@ -1,10 +1,220 @@
 import pandas as pd
+import numpy as np
 import streamlit as st
 from typing import List, Dict, Any, Optional
 import hashlib
 import time
 import random
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# pyarrow é opcional (vem com o streamlit): strings Arrow com fallback para object
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Colunas de baixa cardinalidade mantidas como category (value_counts/nunique sobre códigos inteiros)
+CATEGORICAL_COLUMNS = ['UF', 'MUNICIPIO', 'DES_STATUS_FORMULARIO', 'GRAVIDADE_INFRACAO', 'TIPO_INFRACAO']
+
+# Códigos numéricos (IBGE) guardados como inteiro compacto em vez de texto
+INTEGER_COLUMNS = ['COD_MUNICIPIO']
+
+# Coordenadas chegam como texto com vírgula decimal; viram float uma única vez na carga.
+# float32 (~7 dígitos) sobra para o mapa, que agrega em células de 0,01°
+COORDINATE_COLUMNS = ['NUM_LATITUDE_AUTO', 'NUM_LONGITUDE_AUTO']
+COORDINATE_DTYPE = 'float32'
+
+# Páginas buscadas em paralelo: cada requisição é I/O de rede, então as latências se sobrepõem
+PAGINATION_WORKERS = 8
+
+# Tentativas por página antes de desistir da busca (uma página faltando deixaria os dados incompletos)
+PAGE_FETCH_ATTEMPTS = 3
+
+def parse_decimal_values(values: pd.Series, dtype: str = 'float64') -> pd.Series:
+    """Converte texto com vírgula decimal para float (vazios e inválidos viram NaN)."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(dtype)
+    if PYARROW_AVAILABLE and isinstance(values.dtype, pd.StringDtype) and values.dtype.storage == 'pyarrow':
+        # Caminho Arrow: troca a vírgula e converte direto no buffer, sem Series intermediária de object
+        arr = pa.array(values.array)
+        arr = pc.replace_substring(arr, ',', '.')
+        arr = pc.if_else(pc.equal(arr, ''), pa.scalar(None, pa.string()), arr)
+        try:
+            floats = pc.cast(arr, pa.float64())
+            return pd.Series(floats.to_numpy(zero_copy_only=False), index=values.index, name=values.name).astype(dtype)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass  # Texto não numérico: to_numeric abaixo o transforma em NaN
+    if not isinstance(values.dtype, pd.StringDtype):
+        values = values.astype(str)
+    return pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce').astype(dtype)
+
+def parse_infraction_dates(values: pd.Series) -> pd.Series:
+    """Converte DAT_HORA_AUTO_INFRACAO (texto ISO 'YYYY-MM-DD HH:MM:SS') sem inferir formato linha a linha."""
+    return pd.to_datetime(values, format='ISO8601', errors='coerce')
+
+def year_range_mask(dates: pd.Series, year_range: tuple) -> pd.Series:
+    """Datas dentro do intervalo de anos, comparando timestamps direto (sem materializar .dt.year); NaT fica de fora."""
+    if isinstance(dates.dtype, pd.DatetimeTZDtype):
+        dates = dates.dt.tz_localize(None)  # mantém a data/hora local
+    return (dates >= pd.Timestamp(year_range[0], 1, 1)) & (dates < pd.Timestamp(year_range[1] + 1, 1, 1))
+
+def arrow_to_pandas(table) -> pd.DataFrame:
+    """Converte uma tabela Arrow mantendo o texto como string[pyarrow] (sem passar por object)."""
+    string_dtype = pd.StringDtype('pyarrow')
+    return table.to_pandas(types_mapper={pa.string(): string_dtype, pa.large_string(): string_dtype}.get)
+
+def records_to_dataframe(records: list) -> pd.DataFrame:
+    """Monta o DataFrame das linhas JSON do PostgREST via Arrow; tipos mistos ou sem pyarrow caem no pandas."""
+    if PYARROW_AVAILABLE and records:
+        try:
+            return arrow_to_pandas(pa.Table.from_pylist(records))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    return pd.DataFrame(records)
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte coordenadas para float, datas para datetime, texto repetitivo para category e o restante para strings Arrow."""
+    for col in COORDINATE_COLUMNS:
+        if col in df.columns:
+            df[col] = parse_decimal_values(df[col], COORDINATE_DTYPE)
+    
+    # Data convertida uma única vez na carga; os filtros reutilizam DATE_PARSED
+    if 'DAT_HORA_AUTO_INFRACAO' in df.columns and 'DATE_PARSED' not in df.columns:
+        df['DATE_PARSED'] = parse_infraction_dates(df['DAT_HORA_AUTO_INFRACAO'])
+    
+    # Valor da multa convertido uma única vez na carga; os gráficos só leem VAL_AUTO_INFRACAO_NUMERIC.
+    # Fica em float64: float32 perde os centavos a partir de ~R$ 100 mil, e os valores são exibidos em reais
+    if 'VAL_AUTO_INFRACAO' in df.columns and 'VAL_AUTO_INFRACAO_NUMERIC' not in df.columns:
+        df['VAL_AUTO_INFRACAO_NUMERIC'] = parse_decimal_values(df['VAL_AUTO_INFRACAO'])
+    
+    for col in INTEGER_COLUMNS:
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col]):
+            try:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int32')
+            except (TypeError, ValueError):
+                pass  # Códigos fora do padrão: mantém como texto
+    
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and (df[col].dtype == object or isinstance(df[col].dtype, pd.StringDtype)):
+            df[col] = df[col].astype('category')
+    
+    # Status é exibido em title case: converte só as categorias (poucas), uma vez na carga
+    if 'DES_STATUS_FORMULARIO' in df.columns and df['DES_STATUS_FORMULARIO'].dtype.name == 'category':
+        categories = df['DES_STATUS_FORMULARIO'].cat.categories
+        titled = categories.astype(str).str.title()
+        if titled.is_unique:
+            # Só renomeia o dicionário: os códigos das linhas ficam intactos (sem passada O(N))
+            df['DES_STATUS_FORMULARIO'] = df['DES_STATUS_FORMULARIO'].cat.rename_categories(titled)
+        else:
+            # Variantes de caixa ("LAVRADO"/"Lavrado") se fundem numa mesma categoria
+            df['DES_STATUS_FORMULARIO'] = df['DES_STATUS_FORMULARIO'].map(dict(zip(categories, titled))).astype('category')
+    
+    if PYARROW_AVAILABLE:
+        # notna/str.replace/comparações passam a rodar nos kernels do Arrow
+        text_cols = df.select_dtypes(include='object').columns
+        if len(text_cols) > 0:
+            df[text_cols] = df[text_cols].astype('string[pyarrow]')
+    
+    return df
+
+def non_empty_mask(values: pd.Series) -> np.ndarray:
+    """Máscara 'não nulo e não vazio' calculada em uma única passada sobre a coluna."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Avalia só as categorias; o código -1 (nulo) cai na posição extra False
+        keep = np.append(np.asarray(values.cat.categories != ''), False)
+        return keep[values.cat.codes.to_numpy()]
+    if isinstance(values.dtype, pd.StringDtype):
+        # Comprimento > 0 já exclui nulos (kernel único no Arrow)
+        return values.str.len().gt(0).fillna(False).to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.notna().to_numpy()
+    return (values.notna() & (values != '')).to_numpy()
+
+# Linha mantida de um NUM_AUTO_INFRACAO repetido: a primeira por data/hora e UF (nulos por último),
+# a mesma ordem do ROW_NUMBER das consultas SQL (DEDUP_ORDER_SQL em database.py); empates completos
+# ficam com a ordem de chegada
+DEDUP_ORDER_COLUMNS = ['DAT_HORA_AUTO_INFRACAO', 'UF']
+
+def first_infraction_mask(df: pd.DataFrame, codes: np.ndarray = None) -> np.ndarray:
+    """
+    Máscara das linhas mantidas na deduplicação por NUM_AUTO_INFRACAO (IDs nulos ou vazios ficam fora),
+    independente da ordem em que as páginas chegaram. codes: pd.factorize dos IDs, se já calculado.
+    """
+    ids = df['NUM_AUTO_INFRACAO']
+    valid = non_empty_mask(ids)
+    if codes is None:
+        codes = pd.factorize(ids)[0]
+    repeated = valid & pd.Series(codes).duplicated(keep=False).to_numpy()
+    if not repeated.any():
+        return valid
+    
+    # Ordena só as linhas dos IDs repetidos
+    positions = np.flatnonzero(repeated)
+    order = pd.DataFrame({'codigo': codes[positions], 'posicao': positions})
+    sort_by = ['codigo']
+    for col in DEDUP_ORDER_COLUMNS:
+        if col in df.columns:
+            values = df[col].iloc[positions].reset_index(drop=True)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('string')  # ordem do texto, não a das categorias
+            order[col] = values
+            sort_by.append(col)
+    first = order.sort_values(sort_by + ['posicao'], na_position='last').drop_duplicates('codigo')['posicao']
+    
+    keep = valid & ~repeated
+    keep[first.to_numpy()] = True
+    return keep
+
+def iter_record_pages(build_query, page_size: int = 1000, max_pages: int = None):
+    """
+    Gera as páginas (listas de registros) de uma consulta PostgREST usando range().
+    build_query() monta uma consulta nova a cada página; page_size não deve passar do max-rows do servidor.
+    max_pages limita quantas páginas são buscadas (None: até o fim da tabela).
+    """
+    offset = 0
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        data = build_query().range(offset, offset + page_size - 1).execute().data
+        if not data:
+            break
+        yield data
+        pages += 1
+        if len(data) < page_size:
+            break
+        offset += page_size
+
+def records_pages_to_dataframe(pages, to_frame=pd.DataFrame) -> pd.DataFrame:
+    """Converte página a página e concatena uma única vez: o JSON de uma página por vez em memória."""
+    frames = [to_frame(page) for page in pages]
+    if not frames:
+        return pd.DataFrame()
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+def year_range_bounds(year_range: tuple) -> tuple:
+    """Intervalo [início, fim) de DAT_HORA_AUTO_INFRACAO (texto 'YYYY-MM-DD HH:MM:SS') para um year_range."""
+    return f"{year_range[0]}-01-01", f"{year_range[1] + 1}-01-01"
+
+def filter_date_ranges(query, date_ranges):
+    """
+    Aplica à consulta PostgREST um ou mais intervalos [início, fim) de DAT_HORA_AUTO_INFRACAO.
+    Aceita um único par (início, fim) ou uma lista deles; vários intervalos viram um or=(and(...),...).
+    Datas são texto ISO: a comparação lexicográfica equivale à cronológica.
+    """
+    if not date_ranges:
+        return query
+    if isinstance(date_ranges[0], str):
+        date_ranges = [date_ranges]
+    
+    if len(date_ranges) == 1:
+        start, end = date_ranges[0]
+        return query.gte('DAT_HORA_AUTO_INFRACAO', start).lt('DAT_HORA_AUTO_INFRACAO', end)
+    
+    return query.or_(','.join(
+        f"and(DAT_HORA_AUTO_INFRACAO.gte.{start},DAT_HORA_AUTO_INFRACAO.lt.{end})" for start, end in date_ranges
+    ))
 
 class SupabasePaginator:
     """Classe CORRIGIDA DEFINITIVAMENTE para buscar dados únicos do Supabase."""
@@ -23,6 +233,23 @@ class SupabasePaginator:
         filter_hash = hashlib.md5(f"{table_name}_{filters}_{session_id}".encode()).hexdigest()[:8]
         return f"data_{session_id}_{filter_hash}"
     
+    def _filtered_query(self, table_name: str, columns: str = '*', selected_ufs: List[str] = None, date_range: tuple = None,
+                        required_columns: List[str] = None, count: str = None):
+        """Monta a consulta com os filtros aplicados no servidor (PostgREST), não no pandas."""
+        query = self.supabase.table(table_name).select(columns, count=count)
+        
+        if selected_ufs:
+            query = query.in_('UF', list(selected_ufs))
+        
+        # Um intervalo ou a lista exata de períodos selecionados
+        query = filter_date_ranges(query, date_range)
+        
+        # Colunas obrigatórias: "<> ''" no Postgres já descarta os nulos (NULL <> '' não é verdadeiro)
+        for col in required_columns or []:
+            query = query.neq(col, '')
+        
+        return query
+
     def get_real_count_corrected(self, table_name: str = 'ibama_infracao') -> Dict[str, Any]:
         """
         VERSÃO CORRIGIDA DEFINITIVA: Conta registros únicos corretamente.
@@ -120,71 +347,116 @@ class SupabasePaginator:
                 'error': str(e)
             }
     
-    def get_all_records_corrected(self, table_name: str = 'ibama_infracao', cache_key: str = None) -> pd.DataFrame:
+    def get_all_records_corrected(self, table_name: str = 'ibama_infracao', cache_key: str = None,
+                                  selected_ufs: List[str] = None, date_range: tuple = None,
+                                  columns: List[str] = None, required_columns: List[str] = None,
+                                  cache_in_session: bool = True) -> pd.DataFrame:
         """
         VERSÃO CORRIGIDA DEFINITIVA: Busca TODOS os registros únicos corretamente.
+        Filtros de UF, intervalo de datas [início, fim), colunas e colunas obrigatórias
+        (não nulas e não vazias) são enviados ao servidor.
+        cache_in_session=False: não guarda o resultado em st.session_state (quem chama já mantém um cache).
         """
-        if cache_key is None:
-            cache_key = self._get_session_key(table_name)
+        select_columns = ','.join(columns) if columns else '*'
         
-        cache_storage_key = f"paginated_data_{cache_key}"
-        if cache_storage_key in st.session_state:
-            print(f"✅ Retornando dados únicos do cache da sessão")
-            return st.session_state[cache_storage_key]
+        cache_storage_key = None
+        if cache_in_session:
+            if cache_key is None:
+                cache_key = self._get_session_key(table_name, f"ufs_{selected_ufs}_dates_{date_range}_cols_{columns}_req_{required_columns}")
+            cache_storage_key = f"paginated_data_{cache_key}"
+            if cache_storage_key in st.session_state:
+                print(f"✅ Retornando dados únicos do cache da sessão")
+                return st.session_state[cache_storage_key]
         
         print(f"🔄 BUSCA CORRIGIDA: Carregando TODOS os dados únicos...")
         
-        all_data = []
-        page = 0
-        
-        while True:
+        def fetch_page(page: int, count: str = None):
             start = page * self.page_size
             end = start + self.page_size - 1
-            
             print(f"   📄 Página {page + 1}: registros {start} a {end}")
             
-            try:
-                # Busca todos os campos
-                result = self.supabase.table(table_name).select('*').range(start, end).execute()
+            # Busca só as colunas pedidas, das linhas que passam nos filtros.
+            # Falhas transitórias são repetidas; se a página não vier, a busca inteira falha
+            # (nada é guardado em cache), em vez de devolver dados com uma lacuna
+            for attempt in range(1, PAGE_FETCH_ATTEMPTS + 1):
+                try:
+                    return self._filtered_query(table_name, select_columns, selected_ufs, date_range, required_columns, count).range(start, end).execute()
+                except Exception as e:
+                    print(f"   ❌ Erro na página {page + 1} (tentativa {attempt}/{PAGE_FETCH_ATTEMPTS}): {e}")
+                    if attempt == PAGE_FETCH_ATTEMPTS:
+                        raise Exception(f"Página {page + 1} indisponível: {e}") from e
+                    time.sleep(0.5 * attempt)
+        
+        # A primeira página também traz o total (count=exact), que define quantas páginas faltam
+        first = fetch_page(0, count='exact')
+        
+        # Adiciona todos os registros (incluindo possíveis duplicatas)
+        # A deduplicação será feita no final usando pandas
+        all_data = list(first.data or [])
+        print(f"   📊 Carregados: {len(all_data):,} registros na primeira página")
+        
+        total = getattr(first, 'count', None)
+        if total is not None and len(all_data) == self.page_size:
+            n_pages = -(-total // self.page_size)
+            if n_pages > self.max_pages:
+                print(f"   ⚠️ Limite de páginas atingido: {self.max_pages}")
+                n_pages = self.max_pages
+            
+            # Demais páginas em paralelo; os resultados são lidos na ordem das páginas
+            with ThreadPoolExecutor(max_workers=PAGINATION_WORKERS) as executor:
+                futures = [executor.submit(fetch_page, page) for page in range(1, n_pages)]
+                try:
+                    for future in futures:
+                        all_data.extend(future.result().data or [])
+                except Exception:
+                    # Uma página faltou: não espera as que ainda nem começaram
+                    for future in futures:
+                        future.cancel()
+                    raise
+            
+            print(f"   ✅ {n_pages} páginas carregadas (total: {len(all_data):,})")
+        elif len(all_data) == self.page_size:
+            # Servidor sem contagem: segue página a página até uma página incompleta
+            page = 1
+            while page < self.max_pages:
+                result = fetch_page(page)
                 
-                if not result.data or len(result.data) == 0:
+                if not result.data:
                     print(f"   ✅ Fim da paginação na página {page + 1}")
                     break
                 
-                # Adiciona todos os registros (incluindo possíveis duplicatas)
-                # A deduplicação será feita no final usando pandas
                 all_data.extend(result.data)
-                
                 print(f"   📊 Carregados: {len(result.data)} registros (total: {len(all_data):,})")
                 
                 if len(result.data) < self.page_size:
-                    print(f"   ✅ Última página alcançada")
+                    print("   ✅ Última página alcançada")
                     break
                 
                 page += 1
-                
-                if page >= self.max_pages:
-                    print(f"   ⚠️ Limite de páginas atingido: {self.max_pages}")
-                    break
-                
-            except Exception as e:
-                print(f"   ❌ Erro na página {page + 1}: {e}")
-                break
+            else:
+                print(f"   ⚠️ Limite de páginas atingido: {self.max_pages}")
+        else:
+            print("   ✅ Última página alcançada")
         
         print(f"🎉 DADOS CARREGADOS: {len(all_data):,} registros")
         
-        # Converte para DataFrame
-        df = pd.DataFrame(all_data)
+        # Confere com a contagem exata da mesma consulta filtrada (linhas, antes da deduplicação)
+        if total is not None:
+            if len(all_data) >= total:
+                print(f"✅ COMPLETO: {len(all_data):,} de {total:,} registros do filtro")
+            else:
+                print(f"⚠️ PARCIAL: {len(all_data):,} de {total:,} registros do filtro (limite de {self.max_pages} páginas)")
+        
+        # Converte para DataFrame (via Arrow: texto já chega como string[pyarrow])
+        df = records_to_dataframe(all_data)
         
         # DEDUPLICAÇÃO CORRETA usando pandas
         if not df.empty and 'NUM_AUTO_INFRACAO' in df.columns:
             original_count = len(df)
             
-            # Remove registros com NUM_AUTO_INFRACAO inválido
-            df_valid = df[df['NUM_AUTO_INFRACAO'].notna() & (df['NUM_AUTO_INFRACAO'] != '')].copy()
-            
-            # Remove duplicatas mantendo o primeiro registro
-            df_unique = df_valid.drop_duplicates(subset=['NUM_AUTO_INFRACAO'], keep='first')
+            # Remove registros com NUM_AUTO_INFRACAO inválido e duplicatas numa única seleção
+            # (a seleção já é um novo DataFrame; sem .copy())
+            df_unique = df[first_infraction_mask(df)]
             
             final_count = len(df_unique)
             duplicates_removed = original_count - final_count
@@ -194,20 +466,15 @@ class SupabasePaginator:
             print(f"   🔢 Registros únicos: {final_count:,}")
             print(f"   📉 Duplicatas removidas: {duplicates_removed:,}")
             
-            # Verifica se chegou próximo da expectativa
-            expected_unique = 21019
-            if final_count >= expected_unique * 0.98:  # 98% ou mais
-                print(f"🎉 SUCESSO: Carregados {final_count:,} registros únicos (≥98% do esperado)")
-            elif final_count >= expected_unique * 0.90:  # 90% ou mais
-                print(f"⚠️ PARCIAL: Carregados {final_count:,} registros únicos (≥90% do esperado)")
-            else:
-                print(f"❌ INSUFICIENTE: Carregados apenas {final_count:,} registros únicos (<90% do esperado)")
-            
             df = df_unique
         
+        # Tipos compactos para as agregações dos gráficos
+        df = optimize_dtypes(df)
+        
         # Armazena no cache da sessão
-        st.session_state[cache_storage_key] = df
-        print(f"💾 Dados únicos armazenados no cache da sessão")
+        if cache_storage_key:
+            st.session_state[cache_storage_key] = df
+            print(f"💾 Dados únicos armazenados no cache da sessão")
         
         return df
     
@@ -216,9 +483,13 @@ class SupabasePaginator:
         """Método original - chama a versão corrigida."""
         return self.get_real_count_corrected(table_name)
     
-    def get_all_records(self, table_name: str = 'ibama_infracao', cache_key: str = None) -> pd.DataFrame:
+    def get_all_records(self, table_name: str = 'ibama_infracao', cache_key: str = None,
+                        selected_ufs: List[str] = None, date_range: tuple = None,
+                        columns: List[str] = None, required_columns: List[str] = None,
+                        cache_in_session: bool = True) -> pd.DataFrame:
         """Método original - chama a versão corrigida."""
-        return self.get_all_records_corrected(table_name, cache_key)
+        return self.get_all_records_corrected(table_name, cache_key, selected_ufs, date_range, columns, required_columns,
+                                              cache_in_session)
     
     def get_filtered_data(self, selected_ufs: List[str] = None, year_range: tuple = None) -> pd.DataFrame:
         """Busca dados filtrados com garantia de unicidade."""
@@ -227,8 +498,9 @@ class SupabasePaginator:
         
         print(f"🔍 Buscando dados filtrados únicos...")
         
-        # Busca todos os dados únicos desta sessão
-        df = self.get_all_records_corrected('ibama_infracao', cache_key)
+        # UF e intervalo de anos já são filtrados no servidor
+        date_range = year_range_bounds(year_range) if year_range else None
+        df = self.get_all_records_corrected('ibama_infracao', cache_key, selected_ufs, date_range)
         
         if df.empty:
             return df
@@ -236,18 +508,10 @@ class SupabasePaginator:
         original_count = len(df)
         print(f"📊 Dataset base: {original_count:,} registros únicos")
         
-        # Aplica filtros
-        if selected_ufs and 'UF' in df.columns:
-            df = df[df['UF'].isin(selected_ufs)]
-            print(f"   🗺️ Após filtro UF: {len(df):,} registros")
-        
-        if year_range and 'DAT_HORA_AUTO_INFRACAO' in df.columns:
+        # Refinamento no pandas: descarta datas inválidas ou fora do intervalo (já convertidas na carga)
+        if year_range and 'DATE_PARSED' in df.columns:
             try:
-                df['DAT_HORA_AUTO_INFRACAO'] = pd.to_datetime(df['DAT_HORA_AUTO_INFRACAO'], errors='coerce')
-                df = df[
-                    (df['DAT_HORA_AUTO_INFRACAO'].dt.year >= year_range[0]) &
-                    (df['DAT_HORA_AUTO_INFRACAO'].dt.year <= year_range[1])
-                ]
+                df = df[year_range_mask(df['DATE_PARSED'], year_range)]
                 print(f"   📅 Após filtro ano {year_range}: {len(df):,} registros")
             except Exception as e:
                 print(f"   ⚠️ Erro no filtro de data: {e}")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Testes dos utilitários puros usados pelo dashboard (filtros SQL/PostgREST, Top-N,
+grade do mapa e conversão de tipos), conferidos contra o equivalente em pandas.
+"""
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.components.visualization import DataVisualization, _sql_where, _date_ranges, _top_k, _bin_coordinates
+from src.utils.database import DEDUP_ORDER_SQL
+from src.utils.supabase_utils import year_range_bounds, filter_date_ranges, optimize_dtypes, parse_decimal_values, parse_infraction_dates
+
+FILTERS = [
+    {"mode": "simple", "years": [2024, 2025]},
+    {"mode": "simple", "years": [2023]},
+    {"mode": "advanced", "periods": {2024: [1, 2, 3, 12], 2025: [1]}},
+    {"mode": "advanced", "periods": {}},
+]
+
+def _sample_df(n=500, seed=0):
+    """Linhas com datas em texto ISO, IDs vazios/nulos e algumas datas ausentes."""
+    rng = np.random.default_rng(seed)
+    dates = [
+        f"{rng.integers(2023, 2026)}-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d} 10:00:00"
+        if rng.random() > 0.05 else None
+        for _ in range(n)
+    ]
+    ids = [str(100000 + i) if rng.random() > 0.05 else rng.choice(['', None]) for i in range(n)]
+    return pd.DataFrame({
+        'NUM_AUTO_INFRACAO': ids,
+        'UF': rng.choice(['PA', 'AM', 'MT'], n),
+        'DAT_HORA_AUTO_INFRACAO': dates,
+    })
+
+def _pandas_period_mask(df, date_filters):
+    """Filtro de período feito no pandas (ano ou ano-mês do texto ISO)."""
+    dates = df['DAT_HORA_AUTO_INFRACAO']
+    if date_filters["mode"] == "simple":
+        return dates.str[:4].isin([str(year) for year in date_filters["years"]])
+    months = [f"{year}-{month:02d}" for year, selected in date_filters["periods"].items() for month in selected]
+    return dates.str[:7].isin(months)
+
+@pytest.mark.parametrize("date_filters", FILTERS)
+@pytest.mark.parametrize("selected_ufs", [[], ['PA', 'AM']])
+def test_sql_where_matches_pandas(selected_ufs, date_filters):
+    df = _sample_df()
+    sql_rows = duckdb.query_df(df, 'ibama_infracao', f"SELECT * FROM ibama_infracao{_sql_where(selected_ufs, date_filters)}").df()
+
+    ids = df['NUM_AUTO_INFRACAO']
+    mask = ids.notna() & (ids != '') & _pandas_period_mask(df, date_filters)
+    if selected_ufs:
+        mask &= df['UF'].isin(selected_ufs)
+
+    assert sorted(sql_rows['NUM_AUTO_INFRACAO']) == sorted(df.loc[mask, 'NUM_AUTO_INFRACAO'])
+
+@pytest.mark.parametrize("date_filters", FILTERS)
+def test_date_ranges_cover_exactly_the_selected_periods(date_filters):
+    df = _sample_df()
+    ranges = _date_ranges(date_filters)
+    dates = df['DAT_HORA_AUTO_INFRACAO']
+
+    in_ranges = pd.Series(False, index=df.index)
+    for start, end in ranges or []:
+        in_ranges |= dates.notna() & (dates >= start) & (dates < end)
+
+    assert in_ranges.equals(_pandas_period_mask(df, date_filters).fillna(False))
+
+@pytest.mark.parametrize("date_filters", FILTERS)
+@pytest.mark.parametrize("dates", ["text", "parsed", "tz_aware"])
+def test_apply_date_filter_to_dataframe_matches_pandas(date_filters, dates):
+    df = _sample_df()
+    # Fim de ano: com fuso, ano/mês vêm da data local, não de UTC (23:00 em Belém já é 2026 em UTC)
+    df.loc[0, 'DAT_HORA_AUTO_INFRACAO'] = '2025-12-31 23:00:00'
+    expected = df.loc[_pandas_period_mask(df, date_filters).fillna(False), 'NUM_AUTO_INFRACAO'].tolist()
+    if dates != "text":
+        df['DATE_PARSED'] = parse_infraction_dates(df['DAT_HORA_AUTO_INFRACAO'])
+    if dates == "tz_aware":
+        df['DATE_PARSED'] = df['DATE_PARSED'].dt.tz_localize('America/Belem')
+    
+    result = DataVisualization()._apply_date_filter_to_dataframe(df, date_filters)
+    
+    assert (result['NUM_AUTO_INFRACAO'].tolist() if not result.empty else []) == expected
+
+def test_date_ranges_merge_consecutive_months():
+    assert _date_ranges({"mode": "simple", "years": [2024, 2025]}) == [("2024-01-01", "2026-01-01")]
+    assert _date_ranges({"mode": "advanced", "periods": {2024: [11, 12], 2025: [1, 3]}}) == [
+        ("2024-11-01", "2025-02-01"), ("2025-03-01", "2025-04-01")
+    ]
+    assert _date_ranges({"mode": "advanced", "periods": {}}) is None
+
+def test_year_range_bounds_is_half_open():
+    start, end = year_range_bounds((2024, 2025))
+    assert (start, end) == ("2024-01-01", "2026-01-01")
+    assert start <= "2025-12-31 23:59:59" < end
+    assert not ("2026-01-01 00:00:00" < end)
+
+class _RecordingQuery:
+    """Registra os filtros PostgREST aplicados (gte/lt/or_) para conferência."""
+
+    def __init__(self):
+        self.calls = []
+
+    def gte(self, column, value):
+        self.calls.append(('gte', column, value))
+        return self
+
+    def lt(self, column, value):
+        self.calls.append(('lt', column, value))
+        return self
+
+    def or_(self, expression):
+        self.calls.append(('or', expression))
+        return self
+
+def test_filter_date_ranges_builds_postgrest_filters():
+    assert filter_date_ranges(_RecordingQuery(), None).calls == []
+
+    single = filter_date_ranges(_RecordingQuery(), ("2024-01-01", "2025-01-01")).calls
+    assert single == [('gte', 'DAT_HORA_AUTO_INFRACAO', '2024-01-01'), ('lt', 'DAT_HORA_AUTO_INFRACAO', '2025-01-01')]
+
+    several = filter_date_ranges(_RecordingQuery(), [("2024-01-01", "2024-04-01"), ("2024-12-01", "2025-02-01")]).calls
+    assert several == [('or',
+        "and(DAT_HORA_AUTO_INFRACAO.gte.2024-01-01,DAT_HORA_AUTO_INFRACAO.lt.2024-04-01),"
+        "and(DAT_HORA_AUTO_INFRACAO.gte.2024-12-01,DAT_HORA_AUTO_INFRACAO.lt.2025-02-01)"
+    )]
+
+def _with_repeated_ids(df, n_ids=150, seed=2):
+    """Sorteia os IDs válidos entre poucos valores: o mesmo auto aparece em outras datas e UFs."""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    valid = df['NUM_AUTO_INFRACAO'].fillna('') != ''
+    df.loc[valid, 'NUM_AUTO_INFRACAO'] = [str(100000 + i) for i in rng.integers(0, n_ids, int(valid.sum()))]
+    return df
+
+def _rows(df):
+    return sorted(df[['NUM_AUTO_INFRACAO', 'UF', 'DAT_HORA_AUTO_INFRACAO']].astype(object).itertuples(index=False), key=str)
+
+@pytest.mark.parametrize("categorical_uf", [False, True])
+def test_ensure_unique_data_keeps_the_same_row_as_sql(categorical_uf):
+    df = _with_repeated_ids(_sample_df())
+    expected = duckdb.query_df(df, 'ibama_infracao', f"""
+        SELECT * FROM ibama_infracao WHERE "NUM_AUTO_INFRACAO" <> ''
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY "NUM_AUTO_INFRACAO" ORDER BY {DEDUP_ORDER_SQL}) = 1
+    """).df()
+    if categorical_uf:
+        # Ordem das categorias diferente da ordem do texto
+        df['UF'] = df['UF'].astype(pd.CategoricalDtype(['PA', 'MT', 'AM']))
+    
+    viz = DataVisualization()
+    result = viz._ensure_unique_data(df)
+    shuffled = viz._ensure_unique_data(df.sample(frac=1, random_state=0))
+    
+    assert result['NUM_AUTO_INFRACAO'].is_unique
+    assert len(result) < int((df['NUM_AUTO_INFRACAO'].fillna('') != '').sum())
+    assert _rows(result) == _rows(expected)
+    assert _rows(shuffled) == _rows(expected)  # independente da ordem das páginas
+    
+    # Um código inteiro por auto, para as contagens distintas seguintes
+    assert result['NUM_AI_CODE'].dtype == np.int32
+    assert result['NUM_AI_CODE'].is_unique
+
+def test_ensure_unique_data_without_valid_ids():
+    viz = DataVisualization()
+    assert viz._ensure_unique_data(pd.DataFrame({'NUM_AUTO_INFRACAO': ['', None], 'UF': ['PA', 'AM']})).empty
+    no_ids = pd.DataFrame({'UF': ['PA', 'PA']})
+    assert viz._ensure_unique_data(no_ids) is no_ids
+
+@pytest.mark.parametrize("k", [1, 3, 10, 49, 50, 80])
+def test_top_k_matches_nlargest(k):
+    rng = np.random.default_rng(k)
+    values = pd.Series(rng.integers(0, 20, 50), index=[f"g{i}" for i in range(50)])  # muitos empates
+
+    top = _top_k(values, k)
+    # Empates na ordem de aparição, como nlargest(keep='first')
+    expected = values.sort_values(ascending=False, kind='stable').head(k)
+    assert top.index.tolist() == expected.index.tolist()
+    assert top.tolist() == expected.tolist()
+    if k < len(values):
+        assert top.index.tolist() == values.nlargest(k).index.tolist()
+
+def test_bin_coordinates_matches_pandas_groupby():
+    rng = np.random.default_rng(1)
+    lat = rng.uniform(-30, 5, 2000)
+    lon = rng.uniform(-70, -35, 2000)
+
+    cells = _bin_coordinates(lat, lon, 1)
+
+    points = pd.DataFrame({'lat': lat, 'lon': lon, 'cell_lat': np.round(lat * 10), 'cell_lon': np.round(lon * 10)})
+    expected = points.groupby(['cell_lat', 'cell_lon']).agg(lat=('lat', 'mean'), lon=('lon', 'mean'), count=('lat', 'size'))
+
+    assert cells['count'].sum() == len(lat)
+    ordered = cells.sort_values(['lat', 'lon']).reset_index(drop=True)
+    reference = expected.sort_values(['lat', 'lon']).reset_index(drop=True)
+    np.testing.assert_allclose(ordered[['lat', 'lon']].to_numpy(), reference[['lat', 'lon']].to_numpy())
+    assert ordered['count'].tolist() == reference['count'].tolist()
+
+@pytest.mark.parametrize("dtype", [object, 'string'])
+def test_parse_decimal_values_matches_to_numeric(dtype):
+    raw = pd.Series(['1,5', '2.25', '', None, 'abc', '1000', '-3,75'], dtype=dtype)
+
+    parsed = parse_decimal_values(raw)
+    expected = pd.to_numeric(raw.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+
+    assert parsed.dtype == np.float64
+    np.testing.assert_array_equal(parsed.to_numpy(), expected.to_numpy(dtype=float))
+    assert parse_decimal_values(raw, 'float32').dtype == np.float32
+
+def test_parse_decimal_values_keeps_numeric_columns():
+    values = pd.Series([1.5, np.nan, 3.0])
+    np.testing.assert_array_equal(parse_decimal_values(values).to_numpy(), values.to_numpy())
+
+def test_optimize_dtypes():
+    df = pd.DataFrame({
+        'NUM_AUTO_INFRACAO': ['1', '2', '3', '4'],
+        'UF': ['PA', 'AM', 'PA', None],
+        'MUNICIPIO': ['BELEM', 'MANAUS', 'BELEM', 'X'],
+        'COD_MUNICIPIO': ['1501402', '1302603', '1501402', None],
+        'DES_STATUS_FORMULARIO': ['LAVRADO', 'Lavrado', 'em julgamento', None],
+        'DAT_HORA_AUTO_INFRACAO': ['2024-01-02 10:00:00', '2024-13-01 10:00:00', None, '2025-06-30 23:59:59'],
+        'VAL_AUTO_INFRACAO': ['1500,50', '', '200', None],
+        'NUM_LATITUDE_AUTO': ['-1,45', '-3.10', '', None],
+        'NUM_LONGITUDE_AUTO': ['-48,49', '-60.02', None, ''],
+        'NOME_INFRATOR': ['A', 'B', 'C', None],
+    })
+
+    result = optimize_dtypes(df.copy())
+
+    for col in ['UF', 'MUNICIPIO', 'DES_STATUS_FORMULARIO']:
+        assert isinstance(result[col].dtype, pd.CategoricalDtype)
+    assert result['UF'].astype(object).where(result['UF'].notna(), None).tolist() == df['UF'].tolist()
+
+    # Variantes de caixa do status se fundem em title case
+    assert result['DES_STATUS_FORMULARIO'].astype(object).tolist()[:3] == ['Lavrado', 'Lavrado', 'Em Julgamento']
+
+    assert str(result['COD_MUNICIPIO'].dtype) == 'Int32'
+    assert result['COD_MUNICIPIO'].tolist()[:3] == [1501402, 1302603, 1501402]
+
+    for col in ['NUM_LATITUDE_AUTO', 'NUM_LONGITUDE_AUTO']:
+        assert result[col].dtype == np.float32
+        expected = pd.to_numeric(df[col].astype(str).str.replace(',', '.', regex=False), errors='coerce').astype('float32')
+        np.testing.assert_array_equal(result[col].to_numpy(), expected.to_numpy())
+
+    expected_val = pd.to_numeric(df['VAL_AUTO_INFRACAO'].astype(str).str.replace(',', '.', regex=False), errors='coerce')
+    assert result['VAL_AUTO_INFRACAO_NUMERIC'].dtype == np.float64
+    np.testing.assert_array_equal(result['VAL_AUTO_INFRACAO_NUMERIC'].to_numpy(), expected_val.to_numpy())
+
+    # Datas inválidas viram NaT; o texto original é preservado
+    expected_dates = pd.to_datetime(df['DAT_HORA_AUTO_INFRACAO'], errors='coerce', format='%Y-%m-%d %H:%M:%S')
+    assert result['DATE_PARSED'].tolist() == expected_dates.tolist()
+    assert result['DAT_HORA_AUTO_INFRACAO'].tolist()[0] == '2024-01-02 10:00:00'
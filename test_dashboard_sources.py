@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Testes das fontes de dados do dashboard: as agregações no banco (tabela pré-agregada e
+tabela completa) conferidas contra o caminho pandas sobre o mesmo DuckDB local, e a busca
+paginada no Supabase sobre um cliente em memória.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+from postgrest.exceptions import APIError
+
+import config
+import src.utils.database as database_module
+from src.utils.database import Database
+from src.utils.supabase_utils import SupabasePaginator, PAGE_FETCH_ATTEMPTS, records_to_dataframe, first_infraction_mask, optimize_dtypes
+from src.components.visualization import DataVisualization, DASHBOARD_COLUMNS, CHART_COLUMNS, _offender_groups
+
+FILTERS = [
+    ([], {"mode": "simple", "years": [2024, 2025]}),
+    (['PA'], {"mode": "simple", "years": [2024]}),
+    (['PA', 'AM'], {"mode": "advanced", "periods": {2024: [1, 2, 3, 12], 2025: [1, 6]}}),
+]
+
+# CPF, CNPJ (também com espaços em volta) e formatos que não são nenhum dos dois
+DOCUMENTS = ['123.456.789-01', '987.654.321-00', ' 111.222.333-44 ', '12.345.678/0001-90', '98.765.432/0001-10',
+             '11.222.333/0001-8', '123.456.789/01', '12345678901', '']
+
+def _infractions_with_conflicts(n=400, seed=0):
+    """
+    Autos únicos mais duplicatas em conflito: o mesmo NUM_AUTO_INFRACAO em outra UF, em outro mês
+    ou no mesmo mês com outra hora, com gravidade, status, tipo e valor diferentes. Linhas embaralhadas.
+    """
+    rng = np.random.default_rng(seed)
+    ufs = ['PA', 'AM', 'MT']
+
+    def _row(num, uf, year, month, day, hour):
+        return {
+            'NUM_AUTO_INFRACAO': num,
+            'UF': str(uf),
+            'DAT_HORA_AUTO_INFRACAO': f"{year}-{month:02d}-{day:02d} {hour:02d}:00:00",
+            'COD_MUNICIPIO': str(1500000 + int(rng.integers(0, 20))),
+            'MUNICIPIO': f"MUNICIPIO {uf}",
+            'GRAVIDADE_INFRACAO': str(rng.choice(['Baixa', 'Média', 'Alta', ''])),
+            'TIPO_INFRACAO': str(rng.choice(['Flora', 'Fauna', 'Pesca'])),
+            'DES_STATUS_FORMULARIO': str(rng.choice(['Lavrado', 'Cancelado'])),
+            'VAL_AUTO_INFRACAO': f"{rng.integers(100, 100000)},{rng.integers(0, 100):02d}",
+            'NOME_INFRATOR': f"INFRATOR {rng.integers(0, 30)}",
+            'CPF_CNPJ_INFRATOR': str(rng.choice(DOCUMENTS)),
+            'NUM_LATITUDE_AUTO': f"-{rng.integers(1, 10)},{rng.integers(0, 9999):04d}",
+            'NUM_LONGITUDE_AUTO': f"-{rng.integers(45, 60)},{rng.integers(0, 9999):04d}",
+        }
+
+    rows = [
+        _row(str(100000 + i), rng.choice(ufs), int(rng.integers(2024, 2026)), int(rng.integers(1, 13)),
+             int(rng.integers(1, 28)), 10)
+        for i in range(n)
+    ]
+    for original in list(rows[:120]):
+        year, month, day = map(int, original['DAT_HORA_AUTO_INFRACAO'][:10].split('-'))
+        variant = rng.integers(0, 3)
+        if variant == 0:  # outra UF
+            uf = rng.choice([uf for uf in ufs if uf != original['UF']])
+            rows.append(_row(original['NUM_AUTO_INFRACAO'], uf, year, month, day, int(rng.integers(0, 24))))
+        elif variant == 1:  # outro mês
+            rows.append(_row(original['NUM_AUTO_INFRACAO'], original['UF'], year, month % 12 + 1, day, 10))
+        else:  # mesma célula UF/mês, outra hora
+            rows.append(_row(original['NUM_AUTO_INFRACAO'], original['UF'], year, month, day, int(rng.integers(11, 24))))
+
+    df = pd.DataFrame(rows)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+@pytest.fixture
+def viz(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'IS_RUNNING_ON_STREAMLIT_CLOUD', False)
+    monkeypatch.setattr(config, 'DB_PATH', str(tmp_path / 'ibama.duckdb'))
+    monkeypatch.setattr(config, 'PARQUET_DIR', str(tmp_path / 'parquet'))
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    db = Database()
+    infractions = _infractions_with_conflicts()
+    db.connection.execute("CREATE TABLE ibama_infracao AS SELECT * FROM infractions")
+    yield DataVisualization(db)
+    db.connection.close()
+
+def _pandas_aggregates(df):
+    """Contagens e somas dos gráficos feitas no pandas sobre os dados já deduplicados."""
+    gravity = df['GRAVIDADE_INFRACAO'].astype(object).fillna('').replace('', 'Sem avaliação feita')
+    return {
+        'total': len(df),
+        'valor': df['VAL_AUTO_INFRACAO_NUMERIC'].sum(),
+        'states': df['UF'].astype(str).value_counts().to_dict(),
+        'gravity': gravity.value_counts().to_dict(),
+        'status': df['DES_STATUS_FORMULARIO'].astype(str).value_counts().to_dict(),
+        'fine_by_type': df.groupby('TIPO_INFRACAO', observed=True)['VAL_AUTO_INFRACAO_NUMERIC'].sum().to_dict(),
+    }
+
+def _sql_aggregates(viz, selected_ufs, date_filters):
+    total, valor, _ = viz._aggregate_overview(selected_ufs, date_filters)
+    return {
+        'total': total,
+        'valor': valor,
+        'states': viz._aggregate_states(selected_ufs, date_filters).to_dict(),
+        'gravity': viz._aggregate_gravity(selected_ufs, date_filters).to_dict(),
+        'status': viz._aggregate_status(selected_ufs, date_filters).to_dict(),
+        'fine_by_type': viz._aggregate_fine_by_type(selected_ufs, date_filters).to_dict(),
+    }
+
+@pytest.mark.parametrize("use_aggregate_table", [True, False])
+@pytest.mark.parametrize("selected_ufs, date_filters", FILTERS)
+def test_sql_aggregates_match_pandas_with_conflicting_duplicates(viz, selected_ufs, date_filters, use_aggregate_table):
+    if not use_aggregate_table:
+        viz.database._aggregate_ready = False  # força a tabela completa
+    assert (viz.database.get_aggregate_source() is not None) == use_aggregate_table
+
+    df = viz._get_filtered_data_advanced(selected_ufs, date_filters, DASHBOARD_COLUMNS)
+    expected = _pandas_aggregates(df)
+    result = _sql_aggregates(viz, selected_ufs, date_filters)
+
+    assert result['total'] == expected['total']
+    assert result['valor'] == pytest.approx(expected['valor'])
+    for name in ['states', 'gravity', 'status']:
+        assert result[name] == expected[name], name
+    assert result['fine_by_type'] == pytest.approx(expected['fine_by_type'])
+
+@pytest.mark.parametrize("selected_ufs, date_filters", FILTERS)
+def test_sql_offender_classification_matches_pandas(viz, selected_ufs, date_filters):
+    df = viz._get_filtered_data_advanced(selected_ufs, date_filters, DASHBOARD_COLUMNS)
+    expected = _offender_groups(df)
+    result = viz._aggregate_top_offenders(selected_ufs, date_filters)
+    
+    for key in ['total_pf', 'total_empresas', 'total_validos']:
+        assert result[key] == expected[key], key
+    for key in ['pessoas_fisicas', 'empresas']:
+        top = {(row.NOME_INFRATOR, row.CPF_CNPJ_INFRATOR): row.VAL_AUTO_INFRACAO_NUMERIC for row in result[key].itertuples()}
+        reference = {(row.NOME_INFRATOR, row.CPF_CNPJ_INFRATOR): row.VAL_AUTO_INFRACAO_NUMERIC for row in expected[key].itertuples()}
+        assert len(top) == 10
+        assert top == pytest.approx(reference), key
+
+def test_refresh_aggregate_source_rebuilds_the_table(viz):
+    assert viz.database.get_aggregate_source() is not None
+    before = viz._aggregate_overview([], FILTERS[0][1])[0]
+
+    viz.database.connection.execute("DELETE FROM ibama_infracao WHERE \"UF\" = 'PA'")
+    viz.database.refresh_aggregate_source()
+    st.cache_data.clear()
+
+    after = viz._aggregate_overview([], FILTERS[0][1])[0]
+    expected = viz.database.connection.execute(
+        "SELECT COUNT(DISTINCT \"NUM_AUTO_INFRACAO\") FROM ibama_infracao WHERE \"DAT_HORA_AUTO_INFRACAO\" < '2026'"
+    ).fetchone()[0]
+    assert after < before
+    assert after == expected
+
+def test_parquet_export_is_swapped_in_whole(viz, tmp_path):
+    db = viz.database
+    sessions = [Database() for _ in range(4)]  # outras sessões sobre o mesmo arquivo
+    total = db.connection.execute("SELECT COUNT(*) FROM ibama_infracao").fetchone()[0]
+    
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        sources = list(executor.map(lambda session: session.get_parquet_source(), sessions))
+    
+    assert len(set(sources)) == 1 and sources[0].startswith("read_parquet")
+    assert db.connection.execute(f"SELECT COUNT(*) FROM {sources[0]}").fetchone()[0] == total
+    # Só o diretório final fica no lugar: nenhum temporário ou exportação antiga sobra
+    assert sorted(path.name for path in tmp_path.iterdir() if path.name.startswith('parquet')) == ['parquet']
+    
+    # Banco mais novo que a exportação: reexporta por cima da anterior
+    db.connection.execute("DELETE FROM ibama_infracao WHERE \"UF\" = 'PA'")
+    db.connection.execute("CHECKPOINT")
+    marker = tmp_path / 'parquet' / '.exported'
+    os.utime(marker, (0, 0))
+    source = db.get_parquet_source()
+    remaining = db.connection.execute("SELECT COUNT(*) FROM ibama_infracao").fetchone()[0]
+    assert db.connection.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0] == remaining < total
+    assert not (tmp_path / 'parquet' / 'UF=PA').exists()
+
+class _FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class _FakeQuery:
+    """Consulta PostgREST sobre uma lista de registros: filtros, projeção, count e range."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.rows = client.tables.get(name)
+        self.columns = None
+        self.count = None
+        self.bounds = None
+
+    def select(self, columns='*', count=None):
+        self.columns = None if columns in ('*', 'count') else columns.split(',')
+        self.count = count
+        return self
+
+    def _filter(self, keep):
+        self.rows = [row for row in self.rows if keep(row)]
+        return self
+
+    def in_(self, column, values):
+        return self._filter(lambda row: row.get(column) in values)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] >= value)
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] < value)
+
+    def or_(self, expression):
+        # Só o formato de filter_date_ranges: and(COL.gte.início,COL.lt.fim),...
+        ranges = re.findall(r'and\((\w+)\.gte\.([^,]+),\w+\.lt\.([^)]+)\)', expression)
+        return self._filter(lambda row: any(
+            row.get(column) is not None and start <= row[column] < end for column, start, end in ranges
+        ))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] != value)
+
+    def limit(self, n):
+        self.bounds = (0, n - 1)
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        if self.rows is None:
+            raise APIError({'code': '42P01', 'message': f'relation "public.{self.name}" does not exist'})
+        return self.client.respond(self)
+
+class _FakeSupabase:
+    """Cliente Supabase em memória; registra as chamadas de RPC e simula falhas por página (início do range)."""
+
+    def __init__(self, records):
+        self.tables = {'ibama_infracao': records}
+        self.table_calls = 0
+        self.rpc_calls = []
+        self.rpc_error = {'code': 'PGRST202', 'message': 'Could not find the function public.execute_raw_sql'}
+        self.failures = {}
+
+    def table(self, name):
+        self.table_calls += 1
+        return _FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        self.rpc_calls.append(name)
+        raise APIError(self.rpc_error)
+
+    def respond(self, query):
+        rows = query.rows
+        if query.bounds and self.failures.get(query.bounds[0], 0) > 0:
+            self.failures[query.bounds[0]] -= 1
+            raise ConnectionError(f"timeout no range {query.bounds[0]}")
+        if query.bounds:
+            rows = rows[query.bounds[0]:query.bounds[1] + 1]
+        if query.columns:
+            rows = [{col: row.get(col) for col in query.columns} for row in rows]
+        return _FakeResponse(rows, len(query.rows) if query.count == 'exact' else None)
+
+@pytest.fixture
+def cloud_viz(monkeypatch):
+    monkeypatch.setattr(config, 'IS_RUNNING_ON_STREAMLIT_CLOUD', True)
+    monkeypatch.setattr(config, 'SUPABASE_URL', 'https://example.supabase.co')
+    monkeypatch.setattr(config, 'SUPABASE_KEY', 'key')
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    
+    client = _FakeSupabase(_infractions_with_conflicts().to_dict('records'))
+    monkeypatch.setattr(database_module, '_get_supabase_client', lambda url, key: client)
+    return DataVisualization(Database())
+
+def test_missing_rpc_is_tried_once_per_database(cloud_viz):
+    client = cloud_viz.database.supabase
+    filters = FILTERS[0][1]
+    
+    assert cloud_viz._aggregate_overview([], filters) is None
+    assert cloud_viz._aggregate_states([], filters) is None
+    assert cloud_viz._aggregate_gravity([], filters) is None
+    assert client.rpc_calls == ['execute_raw_sql']
+    assert not cloud_viz.database.sql_rpc_available
+
+def test_sql_errors_keep_the_rpc_enabled(cloud_viz):
+    client = cloud_viz.database.supabase
+    client.rpc_error = {'code': '42703', 'message': 'column "x" does not exist'}
+    
+    assert cloud_viz._aggregate_states([], FILTERS[0][1]) is None
+    assert cloud_viz._aggregate_gravity([], FILTERS[0][1]) is None
+    assert len(client.rpc_calls) == 2
+    assert cloud_viz.database.sql_rpc_available
+
+def test_filtered_data_is_cached_once_per_filter(cloud_viz):
+    client = cloud_viz.database.supabase
+    selected_ufs, date_filters = FILTERS[2]
+    
+    first = cloud_viz._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['state'])
+    calls = client.table_calls
+    cloud_viz._render_cache.clear()  # próximo rerun
+    second = cloud_viz._get_filtered_data_advanced(selected_ufs, date_filters, CHART_COLUMNS['fine_by_type'])
+    
+    # Outro gráfico reaproveita a mesma entrada (colunas canônicas), sem nova busca nem cópia na sessão
+    assert not first.empty
+    assert second is first
+    assert client.table_calls == calls
+    assert set(first.columns) >= set(DASHBOARD_COLUMNS)
+    assert not any(str(key).startswith('paginated_data_') for key in st.session_state.keys())
+
+def test_quality_info_reuses_the_dashboard_data(cloud_viz):
+    client = cloud_viz.database.supabase
+    selected_ufs, date_filters = FILTERS[1]
+    
+    df = cloud_viz._get_filtered_data_advanced(selected_ufs, date_filters, DASHBOARD_COLUMNS)
+    calls = client.table_calls
+    quality = cloud_viz.get_data_quality_info(selected_ufs, date_filters)
+    
+    assert client.table_calls == calls
+    assert quality['total_records'] == len(df)
+    # Só as colunas da fonte: as calculadas na carga (valor numérico, data, código) ficam de fora
+    assert quality['columns_count'] == len(DASHBOARD_COLUMNS)
+    assert 'session_isolated' not in quality
+
+@pytest.fixture
+def paginator(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)  # sem espera entre as tentativas
+    paginator = SupabasePaginator(_FakeSupabase(_infractions_with_conflicts().to_dict('records')))
+    paginator.page_size = 50
+    return paginator
+
+def test_paginator_loads_every_page_with_retries(paginator):
+    client = paginator.supabase
+    client.failures = {100: 1, 250: PAGE_FETCH_ATTEMPTS - 1}  # falhas transitórias
+    selected_ufs, date_range = ['PA', 'AM'], ("2024-01-01", "2026-01-01")
+    
+    df = paginator.get_all_records('ibama_infracao', None, selected_ufs, date_range, cache_in_session=False)
+    
+    # Mesmo resultado de uma leitura única e sequencial das linhas filtradas
+    rows = [row for row in client.tables['ibama_infracao']
+            if row['UF'] in selected_ufs and date_range[0] <= row['DAT_HORA_AUTO_INFRACAO'] < date_range[1]]
+    assert len(rows) > 5 * paginator.page_size
+    expected = records_to_dataframe(rows)
+    expected = expected[first_infraction_mask(expected)]
+    pd.testing.assert_frame_equal(df, optimize_dtypes(expected))
+    assert not any(client.failures.values())
+
+def test_paginator_raises_when_a_page_never_loads(paginator):
+    paginator.supabase.failures = {150: PAGE_FETCH_ATTEMPTS}
+    
+    with pytest.raises(Exception, match="Página 4 indisponível"):
+        paginator.get_all_records('ibama_infracao')
+    
+    # Nada parcial fica guardado na sessão
+    assert not any(str(key).startswith('paginated_data_') for key in st.session_state.keys())
@@ -200,6 +200,14 @@ def upload_simple(df_clean, supabase_client):
     
     return successful, failed
 
+def refresh_aggregate_view(supabase_client):
+    """Atualiza a view ibama_agg usada pelos gráficos do dashboard (função refresh_ibama_agg, se criada)."""
+    try:
+        supabase_client.rpc('refresh_ibama_agg', {}).execute()
+        print("✅ View agregada ibama_agg atualizada")
+    except Exception as e:
+        print(f"⚠️ View agregada não atualizada (o dashboard usa a tabela completa): {str(e)[:80]}")
+
 # --- 5. Execução principal ---
 def main():
     try:
@@ -226,6 +234,8 @@ def main():
         
         # 5. Upload
         successful, failed = upload_simple(df_clean, supabase)
+        if successful:
+            refresh_aggregate_view(supabase)
         
         # 6. Relatório
         total = successful + failed